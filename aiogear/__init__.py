@@ -1,8 +1,12 @@
-from aiogear.worker import Worker
+from aiogear.worker import Worker, ManagedWorker, WorkerGroup, ExecutionMode, Progress, Batch
+from aiogear.budget import Budget
 from aiogear.client import Client
+from aiogear.pool import ClientPool
+from aiogear.status import StatusTracker
+from aiogear.admission import AdmissionController
 from aiogear.admin import Admin
 from aiogear.packet import Type as PacketType
 from aiogear.callback_client import CallbackClient
 
 
-__all__ = ['Worker', 'Client', 'Admin', 'PacketType',  'CallbackClient']
+__all__ = ['Worker', 'ManagedWorker', 'WorkerGroup', 'Budget', 'ExecutionMode', 'Progress', 'Batch', 'Client', 'ClientPool', 'StatusTracker', 'AdmissionController', 'Admin', 'PacketType',  'CallbackClient']
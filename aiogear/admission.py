@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from collections import Counter
+from functools import partial
+from aiogear.exception import Overloaded
+
+logger = logging.getLogger(__name__)
+
+SUBMIT_METHODS = [
+    'submit_job', 'submit_job_bg', 'submit_job_high', 'submit_job_high_bg', 'submit_job_low', 'submit_job_low_bg',
+]
+
+
+class _Limit:
+    def __init__(self):
+        # Submissions per second, None while the function isn't throttled
+        self.rate = None
+        self.next = 0
+        self.backlog = 0
+        self.overloaded = False
+        self.submitted = 0
+
+
+class AdmissionController:
+    """
+    Admits submissions of a Client at the pace the workers drain them. At
+    most `max_in_flight` foreground jobs are in flight at once. Every
+    `interval` seconds the queues are read with `admin.status()`; a
+    function whose backlog (total - running jobs) is above `threshold` has
+    its submission rate cut by the `decrease` factor, starting from the rate
+    it was submitted at, otherwise a throttled rate grows by `increase` jobs
+    per second. With `shed` submissions of overloaded functions raise
+    Overloaded instead of waiting.
+    """
+    def __init__(self, client, admin, max_in_flight=1000, threshold=1000, interval=1, increase=10,
+                 decrease=0.5, min_rate=1, shed=False, loop=None):
+        if max_in_flight < 1:
+            raise RuntimeError('max_in_flight must be at least 1')
+        if not 0 < decrease < 1:
+            raise RuntimeError('decrease must be between 0 and 1')
+        self.loop = loop or client.loop
+        self.client = client
+        self.admin = admin
+        self.threshold = threshold
+        self.interval = interval
+        self.increase = increase
+        self.decrease = decrease
+        self.min_rate = min_rate
+        self.shed = shed
+        self.limits = {}
+        self.stats = Counter()
+        self.in_flight = 0
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._polling = None
+        self._polled_at = None
+
+        for method in SUBMIT_METHODS:
+            setattr(self, method, partial(self._submit_job, getattr(client, method), method.endswith('_bg')))
+
+    def start(self):
+        if self._polling is None:
+            self._polled_at = self.loop.time()
+            self._polling = asyncio.ensure_future(self._poll(), loop=self.loop)
+
+    def close(self):
+        if self._polling is not None:
+            self._polling.cancel()
+            self._polling = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def wait_job(self, handle):
+        return self.client.wait_job(handle)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                status = await self.admin.status()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Unable to read the queue status')
+                continue
+            self.update(status)
+
+    def update(self, status):
+        """
+        Adjusts the submission rates to the output of `Admin.status()`.
+        """
+        now = self.loop.time()
+        elapsed = max(now - self._polled_at, 1e-3) if self._polled_at is not None else self.interval
+        self._polled_at = now
+        backlogs = {entry['function']: entry['total'] - entry['running'] for entry in status}
+        for name in backlogs:
+            if name not in self.limits:
+                self.limits[name] = _Limit()
+        for name, limit in self.limits.items():
+            # Functions without a queue are left out of the status
+            limit.backlog = backlogs.get(name, 0)
+            limit.overloaded = limit.backlog > self.threshold
+            if limit.overloaded:
+                rate = limit.rate if limit.rate is not None else limit.submitted / elapsed
+                limit.rate = max(rate * self.decrease, self.min_rate)
+            elif limit.rate is not None:
+                limit.rate += self.increase
+            limit.submitted = 0
+
+    async def _admit(self, name):
+        limit = self.limits.get(name)
+        if limit is None:
+            limit = self.limits[name] = _Limit()
+        if limit.overloaded and self.shed:
+            self.stats['shed'] += 1
+            raise Overloaded('Function {} has a backlog of {} jobs'.format(name, limit.backlog))
+        if limit.rate is not None:
+            now = self.loop.time()
+            at = max(limit.next, now)
+            limit.next = at + 1 / limit.rate
+            if at > now:
+                self.stats['throttled'] += 1
+                await asyncio.sleep(at - now)
+        limit.submitted += 1
+
+    async def _submit_job(self, submit, background, name, *args, **kwargs):
+        await self._admit(name)
+        if background:
+            job_created = await submit(name, *args, **kwargs)
+            self.stats['admitted'] += 1
+            return job_created
+
+        await self._slots.acquire()
+        self.in_flight += 1
+        try:
+            job_created = await submit(name, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        self.stats['admitted'] += 1
+        completed = self.client.handles.get(job_created.handle)
+        if completed is None:
+            # Answered from the cache or completed already
+            self._release()
+        else:
+            completed.add_done_callback(lambda _: self._release())
+        return job_created
+
+    def _release(self):
+        self.in_flight -= 1
+        self._slots.release()
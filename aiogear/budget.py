@@ -0,0 +1,81 @@
+import asyncio
+
+# Pass increment of a member with weight 1, see Budget
+STRIDE = 1 << 20
+
+
+class Budget:
+    """
+    Number of jobs a group of workers may hold at once. While the budget is
+    exhausted, waiting members are granted freed slots by stride scheduling:
+    each grant advances a member's pass by STRIDE / weight and the waiter
+    with the lowest pass goes first, so members get slots in proportion to
+    their weights.
+    """
+    def __init__(self, capacity, loop=None):
+        if capacity < 1:
+            raise RuntimeError('capacity must be at least 1')
+        self.loop = loop or asyncio.get_event_loop()
+        self.capacity = capacity
+        self.in_use = 0
+        self.weights = {}
+        self.passes = {}
+        self.waiters = {}
+        self._waking = None
+
+    def register(self, member, weight=1):
+        if weight <= 0:
+            raise RuntimeError('weight must be positive')
+        self.weights[member] = weight
+        # Newcomers start level with the others rather than owing them slots
+        self.passes[member] = min(self.passes.values(), default=0)
+
+    def unregister(self, member):
+        self.weights.pop(member, None)
+        self.passes.pop(member, None)
+        f = self.waiters.pop(member, None)
+        if f is not None:
+            f.cancel()
+
+    def available(self):
+        return self.capacity - self.in_use
+
+    async def acquire(self, member):
+        if member not in self.weights:
+            self.register(member)
+        f = self.waiters[member] = self.loop.create_future()
+        # Even free slots are handed out on the next iteration, so members
+        # asking at the same time are granted by weight rather than arrival.
+        if self.in_use < self.capacity and self._waking is None:
+            self._waking = self.loop.call_soon(self._wake)
+        try:
+            await f
+        except asyncio.CancelledError:
+            if self.waiters.get(member) is f:
+                del self.waiters[member]
+            elif f.done() and not f.cancelled():
+                # Granted, but cancelled before getting to use it
+                self.release()
+            raise
+
+    def _grant(self, member):
+        self.in_use += 1
+        self.passes[member] += STRIDE / self.weights[member]
+
+    def release(self, count=1):
+        self.in_use -= count
+        # Grant on the next iteration, so a member releasing and acquiring
+        # again right away competes with the ones already waiting.
+        if self.waiters and self._waking is None:
+            self._waking = self.loop.call_soon(self._wake)
+
+    def _wake(self):
+        self._waking = None
+        while self.in_use < self.capacity and self.waiters:
+            member = min(self.waiters, key=self.passes.__getitem__)
+            f = self.waiters.pop(member)
+            if f.done():
+                # Cancelled, its task hasn't got to clean up yet
+                continue
+            self._grant(member)
+            f.set_result(None)
@@ -0,0 +1,141 @@
+import sys
+import time
+from collections import OrderedDict, Counter
+
+
+def sizeof(value):
+    if isinstance(value, memoryview):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """
+    LRU cache of job results. Entries expire `ttl` seconds after they are
+    stored, the least recently used ones are evicted once there are more
+    than `max_entries` of them or their sizes add up to more than
+    `max_bytes`. Hits, misses, evictions and expired entries are counted in
+    `stats`.
+    """
+    def __init__(self, ttl=None, max_entries=1024, max_bytes=None, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.size = 0
+        self.stats = Counter()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return default
+        expires, _, value = entry
+        if expires is not None and expires <= self.clock():
+            self._remove(key)
+            self.stats['expired'] += 1
+            self.stats['misses'] += 1
+            return default
+        self.entries.move_to_end(key)
+        self.stats['hits'] += 1
+        return value
+
+    def set(self, key, value, size=None):
+        if size is None:
+            size = sizeof(value)
+        if key in self.entries:
+            self._remove(key)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires = None if self.ttl is None else self.clock() + self.ttl
+        self.entries[key] = (expires, size, value)
+        self.size += size
+        while len(self.entries) > self.max_entries or (self.max_bytes is not None and self.size > self.max_bytes):
+            _, (_, evicted, _) = self.entries.popitem(last=False)
+            self.size -= evicted
+            self.stats['evictions'] += 1
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+class SqliteCache:
+    """
+    ResultCache stored in a sqlite database, so worker processes of a host
+    could share it. Keys are (function, uuid) pairs, values are str or bytes
+    results. Lookups block the loop for the duration of a local query. Least
+    recently used entries beyond `max_entries` are deleted every
+    `trim_every` stores.
+    """
+    def __init__(self, path, ttl=None, max_entries=100000, trim_every=64, clock=time.time):
+        import sqlite3
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.trim_every = trim_every
+        self.clock = clock
+        self.stats = Counter()
+        self._stores = 0
+        self.db = sqlite3.connect(path, timeout=5, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'key TEXT PRIMARY KEY, value BLOB, text INTEGER, expires REAL, used REAL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+
+    @staticmethod
+    def _key(key):
+        return '\0'.join(key)
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def get(self, key, default=None):
+        key = self._key(key)
+        row = self.db.execute('SELECT value, text, expires FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.stats['misses'] += 1
+            return default
+        value, text, expires = row
+        now = self.clock()
+        if expires is not None and expires <= now:
+            self.db.execute('DELETE FROM results WHERE key = ?', (key,))
+            self.stats['expired'] += 1
+            self.stats['misses'] += 1
+            return default
+        self.db.execute('UPDATE results SET used = ? WHERE key = ?', (now, key))
+        self.stats['hits'] += 1
+        return value.decode('utf8') if text else bytes(value)
+
+    def set(self, key, value, size=None):
+        text = isinstance(value, str)
+        if text:
+            value = value.encode('utf8')
+        now = self.clock()
+        expires = None if self.ttl is None else now + self.ttl
+        self.db.execute(
+            'INSERT OR REPLACE INTO results (key, value, text, expires, used) VALUES (?, ?, ?, ?, ?)',
+            (self._key(key), bytes(value), int(text), expires, now))
+        self._stores += 1
+        if self._stores % self.trim_every:
+            return
+        evicted = self.db.execute(
+            'DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)).rowcount
+        self.stats['evictions'] += max(evicted, 0)
+
+    def clear(self):
+        self.db.execute('DELETE FROM results')
+
+    def close(self):
+        self.db.close()
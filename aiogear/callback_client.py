@@ -1,4 +1,5 @@
 import asyncio
+import logging
 import collections
 from functools import partial
 from . import mixin
@@ -7,6 +8,8 @@ from . import packet
 
 PACKET_TYPES = packet.Type
 
+logger = logging.getLogger(__name__)
+
 
 class CallbackClient(mixin.GearmanProtocolMixin, asyncio.Protocol):
     """
@@ -17,27 +20,51 @@ class CallbackClient(mixin.GearmanProtocolMixin, asyncio.Protocol):
     Public functions are
     - set_update_callback: set a function to be called as updates come from Gearman
     - submit_jobs: send jobs to the Gearman server
+    - results: iterate over results as jobs finish, when created with stream=True
+
+    With stream=True results are handed out by results() instead of being kept
+    until the whole group is finished. Reading from the server is paused while
+    more than max_buffered results are waiting to be consumed. Completion
+    progress events are sent at most once every progress_interval seconds.
     """
     
-    def __init__(self, loop=None):
-        super().__init__(loop=loop)
+    def __init__(self, loop=None, raw=False, high_water=None, low_water=None, max_buffer_size=None,
+                 stream=False, max_buffered=1000, progress_interval=0):
+        super().__init__(
+            loop=loop, raw=raw, high_water=high_water, low_water=low_water, max_buffer_size=max_buffer_size)
         self.transport = None
         self.submit_job = partial(self._submit_job, PACKET_TYPES.SUBMIT_JOB)
         self.submit_job_high = partial(self._submit_job, PACKET_TYPES.SUBMIT_JOB_HIGH)
         self.submit_job_low = partial(self._submit_job, PACKET_TYPES.SUBMIT_JOB_LOW)
-        self.update_callback = lambda *args: None
+        # Updates are dropped until set_update_callback is called
+        self.update_callback = None
         self.pending_handles = collections.defaultdict(list)
         self.handles_to_job = {}
+        # Uuids of submitted jobs in the order their JOB_CREATED is expected
+        self.awaiting_handles = collections.deque()
+        self._closing = None
+        self.stream = stream
+        self.max_buffered = max_buffered
+        self.progress_interval = progress_interval
+        self.job_count = 0
+        self.completed_count = 0
+        self._results = asyncio.Queue()
+        self._last_progress = None
+        self._batched = False
+        self._events = []
+        self._dispatch_handle = None
         self.priority_map = {
             PACKET_TYPES.SUBMIT_JOB_HIGH: self.submit_job_high,
             PACKET_TYPES.SUBMIT_JOB_LOW: self.submit_job_low,
             PACKET_TYPES.SUBMIT_JOB: self.submit_job
         }
 
-    def set_update_callback(self, async_callback):
+    def set_update_callback(self, async_callback, batched=False):
         """
         Sets a function to be called with job data updates.
-        Function should take the arguments event_type, job_uuid, event_data
+        Function should take the arguments event_type, job_uuid, event_data,
+        or a single list of (event_type, job_uuid, event_data) tuples when batched.
+        Events of the same loop iteration are passed in one call.
 
         Event types are as follows:
 
@@ -47,8 +74,10 @@ class CallbackClient(mixin.GearmanProtocolMixin, asyncio.Protocol):
         - complete: contains the string complete, fail, exception depending on how the job finished
 
         :param async_callback: The async function to be called
+        :param batched: Whether the function takes a list of events
         """
         self.update_callback = async_callback
+        self._batched = batched
 
     async def submit_jobs(self, worker_name, jobs):
         """
@@ -63,6 +92,7 @@ class CallbackClient(mixin.GearmanProtocolMixin, asyncio.Protocol):
         self.job_count = len(jobs)
 
         self.accepted_count = 0
+        self.completed_count = 0
         self.completed_results = []
         self.accepted_future = self.loop.create_future()
         self.complete_future = self.loop.create_future()
@@ -80,14 +110,13 @@ class CallbackClient(mixin.GearmanProtocolMixin, asyncio.Protocol):
 
         async def submit_each(uuid, data, priority=PACKET_TYPES.SUBMIT_JOB):
             """
-            Submit each job and wait for the handle to
-            come back in job_accepted()
+            Submit each job without waiting for its handle, JOB_CREATED
+            responses come back in submission order and are matched to
+            the uuids in job_accepted()
             :param uuid: Globally unique identifier for the job
             :param data: Data to pass to generic_worker
             :param priority: What order should the job be taken out of
              the gearman queue
-            :return: Future resolved when all jobs accepted, completed
-            Completed future contains a generator of job results
             """
 
             try:
@@ -95,30 +124,26 @@ class CallbackClient(mixin.GearmanProtocolMixin, asyncio.Protocol):
             except KeyError:
                 raise Exception("Unsupported priority {}".format(priority))
 
-            self.ready_send_next = self.loop.create_future()
+            self.awaiting_handles.append(uuid)
             await submit_funct(worker_name, data, uuid=uuid)
-            handle = await self.ready_send_next
-            self.handles_to_job[handle] = uuid
 
-            if handle in self.pending_handles:
-                for args in self.pending_handles[handle]:
-                    self.notify(*args)
-                    self.pending_handles[handle] = None
+        if not jobs:
+            self.accepted_future.set_result(True)
+            self.complete_future.set_result(self.get_results())
 
         for params in jobs:
             await submit_each(*params)
 
         return self.accepted_future, self.complete_future
 
-    def connection_made(self, transport):
-        self.transport = transport
-
     def connection_lost(self, exc):
-        self.transport = None
+        super().connection_lost(exc)
         if self._closing:
             self._closing.set_result(exc)
 
     def notify(self, event_type, handler, data):
+        if self.update_callback is None:
+            return
 
         if handler:
             uuid = self.handles_to_job.get(handler)
@@ -128,32 +153,79 @@ class CallbackClient(mixin.GearmanProtocolMixin, asyncio.Protocol):
         else:
             uuid = None
 
-        self.loop.create_task(self.update_callback(event_type, uuid, data))
+        self._events.append((event_type, uuid, data))
+        if self._dispatch_handle is None:
+            self._dispatch_handle = self.loop.call_soon(self._dispatch)
+
+    def _dispatch(self):
+        self._dispatch_handle = None
+        events, self._events = self._events, []
+        self.loop.create_task(self._run_callbacks(events))
+
+    async def _run_callbacks(self, events):
+        if self._batched:
+            try:
+                await self.update_callback(events)
+            except Exception:
+                logger.exception('Update callback failed on %d events', len(events))
+            return
+        for event in events:
+            try:
+                await self.update_callback(*event)
+            except Exception:
+                logger.exception('Update callback failed on %r', event)
 
     def jobs_accepted(self, *args):
         self.accepted_count += 1
         handle = args[0][1][0]
-        self.ready_send_next.set_result(handle)
+        self.handles_to_job[handle] = self.awaiting_handles.popleft()
+
+        for event in self.pending_handles.pop(handle, ()):
+            self.notify(*event)
 
         if self.accepted_count == self.job_count:
             self.accepted_future.set_result(True)
 
     def jobs_completed(self, *args):
+        packet_type, response = args[0]
+        state = packet_type.name.split('_')[-1]
+        data = response[1] if len(response) > 1 else None
+        self.completed_count += 1
+
+        now = self.loop.time()
+        if self.completed_count == self.job_count or self._last_progress is None or \
+                now - self._last_progress >= self.progress_interval:
+            self._last_progress = now
+            self.notify('progress', None, {
+                'complete': self.completed_count,
+                'total': self.job_count
+            })
+
+        self.notify('complete', response.handle, packet_type.name)
+
+        if self.stream:
+            self._results.put_nowait({'uuid': self.handles_to_job.get(response.handle), 'state': state, 'data': data})
+            if self._results.qsize() >= self.max_buffered and not self._reading_paused:
+                self.pause_reading()
+        else:
+            self.completed_results.append((state, data))
+        self.handles_to_job.pop(response.handle, None)
 
-        self.completed_results.append((
-            args[0][0].name.split('_')[-1],
-            args[-1][1][1]
-        ))
-
-        self.notify('progress', None, {
-            'complete': len(self.completed_results),
-            'total': self.job_count
-        })
-
-        self.notify('complete', args[0][1][0], args[0][0].name)
+        if self.completed_count == self.job_count:
+            self.complete_future.set_result(None if self.stream else self.get_results())
 
-        if len(self.completed_results) == self.job_count:
-            self.complete_future.set_result(self.get_results())
+    async def results(self):
+        """
+        Yields a dict with uuid, state string and job data for every job of
+        the group as it finishes. Only available with stream=True.
+        """
+        if not self.stream:
+            raise RuntimeError('Results are only streamed by a CallbackClient created with stream=True')
+        while not (self._results.empty() and self.completed_count == self.job_count):
+            result = await self._results.get()
+            if self._reading_paused and self._results.qsize() <= self.max_buffered // 2:
+                self.resume_reading()
+            yield result
 
     def get_results(self):
         """
@@ -168,33 +240,31 @@ class CallbackClient(mixin.GearmanProtocolMixin, asyncio.Protocol):
         self.notify('data', handle, output)
 
     def job_warning(self, packet):
-        handle, output = map(lambda i: i.decode('ascii'), self._split(packet[1]))
+        noti_type, data = packet
+        handle, output = data
         self.notify('warning', handle, output)
 
     def job_status(self, packet):
-        parts = self._split(packet[1])
-        self.notify('status', parts[0].decode('ascii'), {
-            'complete': int(parts[1]),
-            'total': int(parts[2])
+        noti_type, data = packet
+        self.notify('status', data.handle, {
+            'complete': data.numerator,
+            'total': data.denominator
         })
 
     async def _submit_job(self, packet, name, data, uuid=None):
+        await self.drain()
         self.send(packet, name, uuid, data)
         return uuid
 
     def get_registered(self, packet):
 
         def multi_cb(*args):
-            output = []
-            for key, cb in self._registers:
-                if packet in key:
-                    output.append(cb(args))
-
-            return output
+            return [cb(args) for cb in self.registered(packet)]
 
         return multi_cb
 
     def disconnect(self):
+        self._flush_writes()
         self.transport.close()
         f = self._closing = self.loop.create_future()
         return f
@@ -2,16 +2,46 @@ import asyncio
 import logging
 import uuid
 import random
+import hashlib
+import itertools
+from collections import Counter, OrderedDict
 from functools import partial
 from aiogear.packet import Type
 from aiogear.mixin import GearmanProtocolMixin
+from aiogear.response import JobCreated, WorkComplete, WorkData, WorkFail, WorkException
+from aiogear.exception import JobTimeout
 
 logger = logging.getLogger(__name__)
 
+BACKGROUND = frozenset([
+    Type.SUBMIT_JOB_BG,
+    Type.SUBMIT_JOB_HIGH_BG,
+    Type.SUBMIT_JOB_LOW_BG,
+    Type.SUBMIT_JOB_SCHED,
+    Type.SUBMIT_JOB_EPOCH,
+    Type.SUBMIT_REDUCE_JOB_BACKGROUND,
+])
+COMPLETION = frozenset([Type.WORK_COMPLETE, Type.WORK_FAIL, Type.WORK_EXCEPTION])
+UPDATES = frozenset([Type.WORK_DATA, Type.WORK_STATUS, Type.WORK_WARNING])
+
+
+_MISS = object()
+
 
 class Client(GearmanProtocolMixin, asyncio.Protocol):
-    def __init__(self, loop=None):
-        super(Client, self).__init__(loop=loop)
+    # Cache hits, expired jobs and jobs completed before their submitter
+    # resumed, kept around for wait_job
+    _max_hits = 10000
+    # Completed streams nobody iterates yet, kept with their chunks for stream()
+    _max_finished_streams = 100
+
+    def __init__(self, loop=None, raw=False, codec=None, high_water=None, low_water=None, max_buffer_size=None,
+                 coalesce=False, cache=None):
+        # Codecs work on the undecoded payloads
+        super(Client, self).__init__(
+            loop=loop, raw=raw or codec is not None, high_water=high_water, low_water=low_water,
+            max_buffer_size=max_buffer_size)
+        self.codec = codec
         self.transport = None
 
         self.submit_job = partial(self._submit_job, Type.SUBMIT_JOB)
@@ -22,7 +52,21 @@ class Client(GearmanProtocolMixin, asyncio.Protocol):
         self.submit_job_low_bg = partial(self._submit_job, Type.SUBMIT_JOB_LOW_BG)
 
         self.handles = {}
+        self.streams = {}
+        self._streaming = set()
+        self._finished_streams = OrderedDict()
         self._closing = None
+        # Submissions of a unique job already in flight share its JOB_CREATED
+        self.coalesce = coalesce
+        self.inflight = {}
+        self.stats = Counter()
+        # ResultCache per function name, hits are answered without a round trip
+        self.cache = cache or {}
+        self._hits = OrderedDict()
+        self._hit_ids = itertools.count()
+        # JobTimeout of jobs given up on, for a late wait_job or stream
+        self._expired = OrderedDict()
+        self._completed = OrderedDict()
 
     def __del__(self):
         try:
@@ -37,27 +81,308 @@ class Client(GearmanProtocolMixin, asyncio.Protocol):
         replacement = chr(random.randint(32, 126)).encode('ascii')
         return uuid.uuid4().bytes.replace(b'\0', replacement)
 
-    def connection_made(self, transport):
-        self.transport = transport
-
     def connection_lost(self, exc):
-        self.transport = None
+        super(Client, self).connection_lost(exc)
+        self.inflight.clear()
         if self._closing:
             self._closing.set_result(exc)
 
     async def _submit_job(self, packet, name, *args, **kwargs):
         uuid = kwargs.pop('uuid', None)
+        stream = kwargs.pop('stream', False)
+        timeout = kwargs.pop('timeout', None)
+        deadline = None if timeout is None else self.loop.time() + timeout
+        args = self._encode(args)
+        cache = None if packet in BACKGROUND or stream else self.cache.get(name)
+        if cache is not None:
+            cache_key = (name, self._digest(args))
+            result = cache.get(cache_key, _MISS)
+            if result is not _MISS:
+                return self._cache_hit(result)
+        # Only unique jobs named by the caller could be submitted twice,
+        # streams have a single consumer.
+        key = None
+        if self.coalesce and uuid is not None and not stream:
+            key = (packet in BACKGROUND, name, uuid)
+            shared = self.inflight.get(key)
+            if shared is not None:
+                self.stats['coalesced'] += 1
+                job_created, completed = await self._job_created_by(asyncio.shield(shared), deadline)
+                if completed is not None:
+                    self._keep_completed(job_created.handle, completed)
+                return job_created
         if uuid is None:
             uuid = self.uuid()
-        jc_f = self.wait_for(Type.JOB_CREATED)
-        w_f = self.wait_for(Type.WORK_COMPLETE, Type.WORK_FAIL, Type.WORK_EXCEPTION)
-        self.send(packet, name, uuid, *args)
-        job_created = await jc_f
-        handle = job_created.handle
-        self.handles[handle] = w_f
-        w_f.add_done_callback(lambda _: self.handles.pop(handle))
+        # Don't pile up submissions gearmand isn't reading yet
+        await self.drain()
+        self.stats['submitted'] += 1
+        f = self._send_job(packet, name, uuid, *args, stream=stream)
+        if key is not None:
+            self.inflight[key] = f
+            f.add_done_callback(partial(self._job_created, key))
+            f = asyncio.shield(f)
+        job_created, completed = await self._job_created_by(f, deadline)
+        if completed is not None:
+            if cache is not None:
+                self._cache_result(cache, cache_key, completed)
+            if deadline is not None:
+                self._expire_at(deadline, job_created.handle, completed)
+            self._keep_completed(job_created.handle, completed)
         return job_created
 
+    def _keep_completed(self, handle, completed):
+        # The job may complete in the same read as JOB_CREATED, it is no
+        # longer tracked by the time its submitter resumes.
+        if completed.done():
+            self._completed[handle] = completed
+            while len(self._completed) > self._max_hits:
+                self._completed.popitem(last=False)
+
+    async def _job_created_by(self, f, deadline):
+        if deadline is None:
+            return await f
+        try:
+            return await asyncio.wait_for(f, max(deadline - self.loop.time(), 0))
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            raise JobTimeout('Job is not created in time')
+
+    def _expire_at(self, deadline, handle, completed):
+        if completed.done():
+            return
+        timer = self.loop.call_at(deadline, self._expire, handle)
+        completed.add_done_callback(lambda _: timer.cancel())
+
+    def _expire(self, handle):
+        # Late WORK_* packets of the job are dropped as untracked
+        self.stats['timeouts'] += 1
+        exc = self._expired[handle] = JobTimeout('Job {} timed out'.format(handle), handle=handle)
+        while len(self._expired) > self._max_hits:
+            self._expired.popitem(last=False)
+        queue = self.streams.pop(handle, None)
+        if queue is not None:
+            queue.put_nowait(exc)
+        f = self.handles.pop(handle, None)
+        if f is not None and not f.done():
+            f.set_exception(exc)
+            # Waiting for the job is optional, don't log it as unretrieved
+            f.exception()
+
+    @staticmethod
+    def _digest(args):
+        workload = args[-1] if args else b''
+        if isinstance(workload, str):
+            workload = workload.encode('utf8')
+        return hashlib.sha1(workload).digest()
+
+    def _cache_hit(self, result):
+        handle = 'C:cache:{}'.format(next(self._hit_ids))
+        self._hits[handle] = WorkComplete(handle, result)
+        while len(self._hits) > self._max_hits:
+            self._hits.popitem(last=False)
+        return JobCreated(handle)
+
+    @staticmethod
+    def _cache_result(cache, key, completed):
+        def store(_):
+            if completed.cancelled() or completed.exception() is not None:
+                return
+            response = completed.result()
+            if isinstance(response, WorkComplete):
+                cache.set(key, response.result)
+
+        completed.add_done_callback(store)
+
+    def _job_created(self, key, f):
+        def forget(_=None):
+            if self.inflight.get(key) is f:
+                del self.inflight[key]
+
+        background, _, _ = key
+        if f.cancelled() or f.exception() or background:
+            forget()
+            return
+        # Foreground jobs are in flight until they complete
+        _, completed = f.result()
+        completed.add_done_callback(forget)
+
+    def _encode(self, args):
+        if self.codec is not None and args:
+            # The workload is always the last argument
+            args = args[:-1] + (self.codec.encode(args[-1]),)
+        return args
+
+    async def submit_many(self, name, workloads, priority=Type.SUBMIT_JOB, window=1000, timeout=None):
+        """
+        Submits a job for every workload without waiting for each JOB_CREATED
+        in turn, keeping at most `window` jobs in flight. Yields
+        (uuid, handle, response) as foreground jobs complete, background
+        priorities yield (uuid, handle) once the jobs are created. The
+        response of a foreground job not completed `timeout` seconds after
+        its submission is a JobTimeout.
+        """
+        if window < 1:
+            raise RuntimeError('window must be at least 1')
+        background = priority in BACKGROUND
+        done = asyncio.Queue()
+
+        def job_created(uuid, deadline, f):
+            response, completed = f.result()
+            handle = response.handle
+            if background:
+                done.put_nowait((uuid, handle))
+                return
+            completed.add_done_callback(partial(job_completed, uuid, handle))
+            if deadline is not None:
+                self._expire_at(deadline, handle, completed)
+
+        def job_completed(uuid, handle, completed):
+            if completed.cancelled():
+                response = asyncio.CancelledError()
+            else:
+                response = completed.exception() or completed.result()
+            done.put_nowait((uuid, handle, response))
+
+        workloads = iter(workloads)
+        in_flight = 0
+        exhausted = False
+        while True:
+            while not exhausted and in_flight < window:
+                try:
+                    workload = next(workloads)
+                except StopIteration:
+                    exhausted = True
+                    break
+                await self.drain()
+                uuid = self.uuid()
+                deadline = None if timeout is None else self.loop.time() + timeout
+                f = self._send_job(priority, name, uuid, *self._encode((workload,)))
+                f.add_done_callback(partial(job_created, uuid, deadline))
+                in_flight += 1
+            if not in_flight:
+                break
+            result = await done.get()
+            in_flight -= 1
+            yield result
+
+    def _send_job(self, packet, name, uuid, *args, stream=False):
+        """
+        Resolves with JOB_CREATED and the future of the job's completion,
+        None for background jobs.
+        """
+        f = self.loop.create_future()
+
+        def job_created(_, response):
+            if f.done():
+                # Given up on before gearmand created it
+                return
+            completed = None
+            # Track the handle before anything else runs, its WORK_* packets
+            # may already be waiting in the same read.
+            if packet not in BACKGROUND:
+                completed = self._track(response.handle)
+                if stream and response.handle not in self.streams:
+                    self.streams[response.handle] = asyncio.Queue()
+                    completed.add_done_callback(partial(self._stream_done, response.handle))
+            f.set_result((response, completed))
+
+        self.do_register(job_created, Type.JOB_CREATED)
+        self.send(packet, name, uuid, *args)
+        return f
+
+    def _track(self, handle):
+        # Unique jobs submitted more than once share the handle.
+        f = self.handles.get(handle)
+        if f is None:
+            f = self.handles[handle] = self.loop.create_future()
+            f.add_done_callback(lambda _: self.handles.pop(handle, None))
+        return f
+
+    def _stream_done(self, handle, _):
+        if handle in self._streaming:
+            return
+        # Nobody consumes the stream, don't buffer its chunks for good
+        queue = self.streams.pop(handle, None)
+        if queue is not None:
+            self._finished_streams[handle] = queue
+            while len(self._finished_streams) > self._max_finished_streams:
+                self._finished_streams.popitem(last=False)
+
+    def get_registered(self, packet):
+        waiter = super(Client, self).get_registered(packet)
+        if packet in COMPLETION:
+            handler = self._job_completed
+        elif packet in UPDATES:
+            handler = self._job_updated
+        else:
+            return waiter
+        if waiter is None:
+            return handler
+        # Packets waited for with wait_for are still routed by handle
+        return partial(self._handle_both, handler, waiter)
+
+    @staticmethod
+    def _handle_both(handler, waiter, packet, response):
+        handler(packet, response)
+        waiter(packet, response)
+
+    def _decode(self, response):
+        try:
+            if isinstance(response, WorkComplete):
+                return response._replace(result=self.codec.decode(response.result))
+            if isinstance(response, WorkData):
+                return response._replace(data=self.codec.decode(response.data))
+        except Exception as ex:
+            logger.exception('Unable to decode %r', response)
+            return WorkException(response.handle, 'Unable to decode result: {}'.format(ex))
+        return response
+
+    def _job_completed(self, _, response):
+        if self.codec is not None:
+            response = self._decode(response)
+        f = self.handles.get(response.handle)
+        if f is None:
+            logger.debug('Received %r for untracked handle', response)
+        elif not f.done():
+            f.set_result(response)
+        queue = self.streams.get(response.handle)
+        if queue is not None:
+            queue.put_nowait(response)
+
+    def _job_updated(self, _, response):
+        queue = self.streams.get(response.handle)
+        if queue is None:
+            logger.debug('Received %r for a handle which is not streamed', response)
+        else:
+            if self.codec is not None:
+                response = self._decode(response)
+            queue.put_nowait(response)
+
+    async def stream(self, handle):
+        """
+        Iterates over WorkData, WorkStatus and WorkWarning updates of a job
+        submitted with stream=True, ending with its completion response.
+        """
+        if handle in self._expired:
+            raise self._expired.pop(handle)
+        queue = self.streams.get(handle)
+        if queue is None:
+            queue = self._finished_streams.pop(handle, None)
+        if queue is None:
+            raise RuntimeError('Job {} is not submitted with stream=True'.format(handle))
+        self._streaming.add(handle)
+        try:
+            while True:
+                update = await queue.get()
+                if isinstance(update, JobTimeout):
+                    raise update
+                yield update
+                if isinstance(update, (WorkComplete, WorkFail, WorkException)):
+                    break
+        finally:
+            self.streams.pop(handle, None)
+            self._streaming.discard(handle)
+
     def submit_job_sched(self, name, dt, *args, **kwargs):
         sched_args = [str(int(x)) for x in dt.strftime('%M %H %d %m %w').split()]
         return self._submit_job(Type.SUBMIT_JOB_SCHED, name, *(sched_args + list(args)), **kwargs)
@@ -67,7 +392,7 @@ class Client(GearmanProtocolMixin, asyncio.Protocol):
         return self.wait_for(Type.STATUS_RES)
 
     def get_status_unique(self, uuid):
-        self.send(Type.STATUS_RES_UNIQUE, uuid)
+        self.send(Type.GET_STATUS_UNIQUE, uuid)
         return self.wait_for(Type.STATUS_RES_UNIQUE)
 
     def option_req(self, option):
@@ -75,12 +400,24 @@ class Client(GearmanProtocolMixin, asyncio.Protocol):
         return self.wait_for(Type.OPTION_RES, Type.ERROR)
 
     def wait_job(self, handle):
-        f = self.handles.get(handle)
+        hit = self._hits.pop(handle, None)
+        if hit is not None:
+            f = self.loop.create_future()
+            f.set_result(hit)
+            return f
+        expired = self._expired.pop(handle, None)
+        if expired is not None:
+            f = self.loop.create_future()
+            f.set_exception(expired)
+            return f
+        # Not popped, coalesced submitters share the handle
+        f = self._completed.get(handle) or self.handles.get(handle)
         if not f:
             raise RuntimeError('Unable to find handle {} in handles {}'.format(handle, self.handles))
         return f
 
     def disconnect(self):
+        self._flush_writes()
         self.transport.close()
         f = self._closing = self.loop.create_future()
         return f
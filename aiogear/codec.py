@@ -0,0 +1,108 @@
+"""
+Payload codecs serializing workloads and results, optionally compressed.
+
+Encoded payloads start with a small header: two magic bytes, the serializer
+key and the compression key. Decoding picks the serializer and compression
+from the header, so peers only need to agree on the codec being in use, not
+on its settings. Payloads without a header are decoded with the configured
+serializer, which keeps plain clients and workers interoperable.
+"""
+import json
+import lzma
+import zlib
+import pickle
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MAGIC = b'\x1eG'
+HEADER_SIZE = len(MAGIC) + 2
+NO_COMPRESSION = b'-'
+
+
+def _to_bytes(obj):
+    if isinstance(obj, str):
+        return obj.encode('utf8')
+    return bytes(obj)
+
+
+SERIALIZERS = {
+    'raw': (b'r', _to_bytes, bytes),
+    'json': (b'j', lambda obj: json.dumps(obj, separators=(',', ':')).encode('utf8'),
+             lambda data: json.loads(bytes(data).decode('utf8'))),
+    'pickle': (b'p', lambda obj: pickle.dumps(obj, pickle.HIGHEST_PROTOCOL), pickle.loads),
+}
+if msgpack is not None:
+    SERIALIZERS['msgpack'] = (
+        b'm', lambda obj: msgpack.packb(obj, use_bin_type=True), lambda data: msgpack.unpackb(data, raw=False))
+
+COMPRESSORS = {
+    'zlib': (b'z', lambda data, level: zlib.compress(data, -1 if level is None else level), zlib.decompress),
+    'lzma': (b'x', lambda data, level: lzma.compress(data, preset=level), lzma.decompress),
+}
+
+
+def register_serializer(name, key, dumps, loads):
+    """
+    Registers a serializer under a single byte key which is used in the
+    payload header.
+    """
+    if len(key) != 1:
+        raise RuntimeError('Serializer key must be a single byte')
+    SERIALIZERS[name] = (key, dumps, loads)
+
+
+class Codec:
+    def __init__(self, serializer='json', compression=None, threshold=1024, level=None, trusted=False):
+        try:
+            self.key, self.dumps, self.loads = SERIALIZERS[serializer]
+        except KeyError:
+            raise RuntimeError('Unsupported serializer {}, must be one of {}{}'.format(
+                serializer, ', '.join(sorted(SERIALIZERS)),
+                '' if msgpack else ' (install msgpack for msgpack support)'))
+        if compression is not None and compression not in COMPRESSORS:
+            raise RuntimeError('Unsupported compression {}, must be one of {}'.format(
+                compression, ', '.join(sorted(COMPRESSORS))))
+        self.serializer = serializer
+        self.compression = compression
+        self.threshold = threshold
+        self.level = level
+        # Unpickling runs arbitrary code, only accept pickles when asked for
+        self.trusted = trusted or serializer == 'pickle'
+
+    def encode(self, obj):
+        payload = self.dumps(obj)
+        compression = NO_COMPRESSION
+        if self.compression and len(payload) >= self.threshold:
+            key, compress, _ = COMPRESSORS[self.compression]
+            compressed = compress(payload, self.level)
+            if len(compressed) < len(payload):
+                compression, payload = key, compressed
+        return b''.join([MAGIC, self.key, compression, payload])
+
+    def decode(self, data):
+        if data[:len(MAGIC)] != MAGIC or len(data) < HEADER_SIZE:
+            return self.loads(data)
+
+        view = memoryview(data)
+        serializer_key, compression_key = bytes(view[len(MAGIC):HEADER_SIZE])
+        payload = view[HEADER_SIZE:]
+        if compression_key != NO_COMPRESSION[0]:
+            payload = self._decompressor(compression_key)(payload)
+        return self._loader(serializer_key)(payload)
+
+    def _decompressor(self, key):
+        for compression_key, _, decompress in COMPRESSORS.values():
+            if compression_key[0] == key:
+                return decompress
+        raise RuntimeError('Unknown compression {!r} in payload header'.format(bytes([key])))
+
+    def _loader(self, key):
+        for name, (serializer_key, _, loads) in SERIALIZERS.items():
+            if serializer_key[0] == key:
+                if name == 'pickle' and not self.trusted:
+                    raise RuntimeError('Refusing to unpickle payload, codec is not trusted')
+                return loads
+        raise RuntimeError('Unknown serializer {!r} in payload header'.format(bytes([key])))
@@ -11,3 +11,11 @@ class WorkFailed(_BaseException):
 
 class WorkException(_BaseException):
     pass
+
+
+class JobTimeout(_BaseException):
+    pass
+
+
+class Overloaded(_BaseException):
+    pass
@@ -1,10 +1,11 @@
 import struct
 import asyncio
 import logging
+from collections import defaultdict, deque, Counter
 from functools import partial
 from aiogear.packet import Type
 from aiogear.utils import to_bool
-from aiogear.response import Noop, NoJob, JobCreated, WorkData
+from aiogear.response import Noop, NoJob, JobCreated, WorkData, WorkWarning, WorkStatus
 from aiogear.response import WorkComplete, WorkFail, WorkException
 from aiogear.response import JobAssign, JobAssignUniq, JobAssignAll
 from aiogear.response import StatusRes, StatusResUnique
@@ -16,24 +17,45 @@ class GearmanProtocolMixin:
     _REQ_MAGIC = b'\0REQ'
     _RES_MAGIC = b'\0RES'
     _delimiter = b'\0'
-    _data = b''
+    _header = struct.Struct('>4sII')
+    # Consumed bytes are dropped from the receive buffer only once they
+    # exceed this size and make up more than half of it.
+    _compact_threshold = 64 * 1024
+    # Consumed waiters left behind in the queues of their other packet
+    # types are purged once they outnumber the live ones.
+    _stale_threshold = 64
+    # Frames announcing a larger payload abort the connection
+    _max_buffer_size = 64 * 1024 * 1024
+    _default_high_water = 64 * 1024
 
-    def __init__(self, loop=None):
+    def __init__(self, loop=None, raw=False, high_water=None, low_water=None, max_buffer_size=None):
         super(GearmanProtocolMixin, self).__init__()
         self.loop = loop or asyncio.get_event_loop()
+        # Keep workloads and results as memoryviews over the received payload
+        self.raw = raw
+        self.transport = None
+        self.high_water = high_water
+        self.low_water = low_water
+        self.max_buffer_size = max_buffer_size or self._max_buffer_size
+        self._paused = False
+        self._drain_waiters = []
+        self._reading_paused = False
         self._serializers = {
-            Type.CAN_DO_TIMEOUT: lambda *xs: self._join(*[str(x) for x in xs])
+            Type.CAN_DO_TIMEOUT: lambda *xs: self._join(*[str(x) for x in xs]),
+            Type.WORK_STATUS: lambda *xs: self._join(*[str(x) for x in xs]),
         }
         self._deserializers = {
-            Type.JOB_ASSIGN: lambda x: JobAssign(*[a.decode('utf8') for a in self._split(x, maxsplit=2)]),
-            Type.JOB_ASSIGN_UNIQ: lambda x: JobAssignUniq(*[a.decode('utf8') for a in self._split(x, maxsplit=3)]),
-            Type.JOB_ASSIGN_ALL: lambda x: JobAssignAll(*[a.decode('utf8') for a in self._split(x, maxsplit=4)]),
+            Type.JOB_ASSIGN: lambda x: JobAssign(*self._fields(x, 2)),
+            Type.JOB_ASSIGN_UNIQ: lambda x: JobAssignUniq(*self._fields(x, 3)),
+            Type.JOB_ASSIGN_ALL: lambda x: JobAssignAll(*self._fields(x, 4)),
             Type.STATUS_RES: self._status_res_handler,
             Type.STATUS_RES_UNIQUE: self._status_res_handler,
-            Type.WORK_COMPLETE: lambda x: WorkComplete(*[a.decode('utf8') for a in self._split(x)]),
-            Type.WORK_DATA: lambda x: WorkData(*[a.decode('utf8') for a in self._split(x)]),
+            Type.WORK_COMPLETE: lambda x: WorkComplete(*self._fields(x, 1)),
+            Type.WORK_DATA: lambda x: WorkData(*self._fields(x, 1)),
+            Type.WORK_WARNING: lambda x: WorkWarning(*self._fields(x, 1)),
+            Type.WORK_STATUS: self._work_status_handler,
             Type.WORK_FAIL: lambda x: WorkFail(self._split(x)[0].decode('utf8')),
-            Type.WORK_EXCEPTION: lambda x: WorkException(*[a.decode('utf8') for a in self._split(x)]),
+            Type.WORK_EXCEPTION: lambda x: WorkException(*self._fields(x, 1)),
             Type.ERROR: self._error_handler,
             Type.NO_JOB: lambda _: NoJob(),
             Type.NOOP: lambda _: Noop(),
@@ -41,27 +63,109 @@ class GearmanProtocolMixin:
         }
         self._request = partial(self._pack, self._REQ_MAGIC)
         self._response = partial(self._pack, self._RES_MAGIC)
-        self._registers = []
+        self._registers = defaultdict(deque)
+        self._stale = Counter()
+        self._buffer = bytearray()
+        self._offset = 0
+        # Packets sent within one loop iteration go out in a single writelines
+        self._outgoing = []
+        self._outgoing_size = 0
+        self._flush_handle = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self._paused = False
+        if self.high_water is not None or self.low_water is not None:
+            transport.set_write_buffer_limits(high=self.high_water, low=self.low_water)
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self._wake_drainers(ConnectionResetError('Connection lost'))
+
+    def pause_writing(self):
+        self._paused = True
+
+    def resume_writing(self):
+        self._paused = False
+        self._wake_drainers()
+
+    def pause_reading(self):
+        """
+        Stops reading from the transport and handling packets which are
+        already received, until resume_reading() is called.
+        """
+        self._reading_paused = True
+        if self.transport:
+            self.transport.pause_reading()
+
+    def resume_reading(self):
+        self._reading_paused = False
+        if self.transport:
+            self.transport.resume_reading()
+        # Handle the packets left over when reading got paused
+        self.data_received(b'')
+
+    def _wake_drainers(self, exc=None):
+        waiters, self._drain_waiters = self._drain_waiters, []
+        for f in waiters:
+            if f.done():
+                continue
+            if exc is None:
+                f.set_result(None)
+            else:
+                f.set_exception(exc)
+
+    async def drain(self):
+        """
+        Waits until the transport accepts more data, i.e. gearmand keeps up
+        with what is sent.
+        """
+        if self.transport is None:
+            raise ConnectionResetError('Connection lost')
+        if not self._paused:
+            return
+        f = self.loop.create_future()
+        self._drain_waiters.append(f)
+        await f
 
     def serializer(self, packet):
         return self._serializers.get(packet, self._join)
 
-    def _unpack(self, data):
-        fmt = '>4sII'
-        fmt_sz = struct.calcsize(fmt)
-        magic, packet_num, sz = struct.unpack(fmt, data[:fmt_sz])
-        begin, end = fmt_sz, fmt_sz + sz
-        if len(data) < end:
-            raise RuntimeError
-        return Type(packet_num), data[begin:end], end
+    def _next_frame(self):
+        buffer, offset = self._buffer, self._offset
+        header_sz = self._header.size
+        if len(buffer) - offset < header_sz:
+            return None
+        magic, packet_num, sz = self._header.unpack_from(buffer, offset)
+        if sz > self.max_buffer_size:
+            raise RuntimeError('Packet of {} bytes exceeds max_buffer_size {}'.format(sz, self.max_buffer_size))
+        begin = offset + header_sz
+        end = begin + sz
+        if len(buffer) < end:
+            return None
+        with memoryview(buffer) as view:
+            payload = bytes(view[begin:end])
+        self._offset = end
+        return Type(packet_num), payload
+
+    def _compact(self):
+        buffer, offset = self._buffer, self._offset
+        if offset == len(buffer):
+            buffer.clear()
+            self._offset = 0
+        elif offset > self._compact_threshold and offset * 2 > len(buffer):
+            del buffer[:offset]
+            self._offset = 0
 
     def _pack(self, magic, packet, payload=b''):
+        return b''.join(self._pack_chunks(magic, packet, payload))
+
+    def _pack_chunks(self, magic, packet, payload=b''):
         assert isinstance(packet, Type)
-        length = len(payload)
-        packed = struct.pack('>4sII', magic, packet.value, length)
         if isinstance(payload, str):
-            payload = payload.encode('ascii')
-        return packed + payload
+            payload = payload.encode('utf8')
+        header = self._header.pack(magic, packet.value, len(payload))
+        return (header, payload) if payload else (header,)
 
     def serialize_response(self, packet_type, *args):
         handler = self.serializer(packet_type)
@@ -79,19 +183,43 @@ class GearmanProtocolMixin:
 
     def _join(self, *args, delimiter=None):
         delimiter = delimiter or self._delimiter
-        args = [a.encode('ascii') if isinstance(a, str) else a for a in args]
+        args = [a.encode('utf8', 'surrogateescape') if isinstance(a, str) else a for a in args]
         return delimiter.join(args)
 
+    def _fields(self, data, maxsplit):
+        # Leading fields such as Client.uuid() may be arbitrary bytes, they
+        # are decoded losslessly and encoded back the same way by _join.
+        if not self.raw:
+            fields = self._split(data, maxsplit=maxsplit)
+            return [a.decode('utf8', 'surrogateescape') for a in fields[:-1]] + [fields[-1].decode('utf8')]
+        # Only the leading fields are copied and decoded, the trailing
+        # workload or result is sliced without a copy.
+        fields, start = [], 0
+        for _ in range(maxsplit):
+            end = data.find(self._delimiter, start)
+            if end < 0:
+                break
+            fields.append(data[start:end].decode('utf8', 'surrogateescape'))
+            start = end + 1
+        fields.append(memoryview(data)[start:])
+        return fields
+
     def do_register(self, callback, *packets):
-        key = packets
-        entry = (key, callback)
-        self._registers.append(entry)
+        # Entry is shared by the queues of all of its packet types, the
+        # callback is cleared once any of them consumes it.
+        key = tuple(set(packets))
+        entry = [key, callback]
+        for packet in key:
+            self._registers[packet].append(entry)
 
     def wait_for(self, *packets, return_response=False):
         f = self.loop.create_future()
 
         def cb(*data):
             packet_type, response = data
+            if f.done():
+                # Waiter is cancelled, e.g. on shutdown
+                return
             if return_response:
                 f.set_result((packet_type, response))
             else:
@@ -100,15 +228,46 @@ class GearmanProtocolMixin:
         return f
 
     def get_registered(self, packet):
-        index = None
-        for i, (key, _) in enumerate(self._registers):
-            if packet in key:
-                index = i
-                break
-        if index is not None:
-            _, cb = self._registers.pop(index)
+        waiters = self._registers.get(packet)
+        while waiters:
+            entry = waiters.popleft()
+            key, cb = entry
+            if cb is None:
+                self._stale[packet] -= 1
+                continue
+            entry[1] = None
+            for other in key:
+                if other is not packet:
+                    self._mark_stale(other)
             return cb
 
+    def _mark_stale(self, packet):
+        self._stale[packet] += 1
+        waiters = self._registers[packet]
+        stale = self._stale[packet]
+        if stale > self._stale_threshold and stale * 2 > len(waiters):
+            self._registers[packet] = deque(e for e in waiters if e[1] is not None)
+            self._stale[packet] = 0
+
+    def registered(self, packet):
+        return [cb for _, cb in self._registers.get(packet, ()) if cb is not None]
+
+    def reset(self):
+        """
+        Drops every waiter and partially received frame, e.g. when the
+        connection they belong to is gone.
+        """
+        self._registers.clear()
+        self._stale.clear()
+        self._buffer.clear()
+        self._offset = 0
+        self._reading_paused = False
+        self._outgoing = []
+        self._outgoing_size = 0
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
     def _cast_args(self, args, casters):
         return [f(x) for f, x in zip(casters, args)]
 
@@ -125,19 +284,30 @@ class GearmanProtocolMixin:
         except IndexError:
             raise RuntimeError('Unable to parse status response %r' % data)
 
+    def _work_status_handler(self, data):
+        args = self._split(data)
+        casters = [lambda x: x.decode('utf8'), int, int]
+        return WorkStatus(*self._cast_args(args, casters))
+
     def _error_handler(self, data):
         args = self._split(data)
         casters = [int, lambda x: x.decode('utf8')]
         return self._cast_args(args, casters)
 
     def data_received(self, data):
-        self._data += data
-        while self._data:
+        self._buffer += data
+        while not self._reading_paused:
             try:
-                packet, payload, offset = self._unpack(self._data)
-            except (struct.error, RuntimeError):
+                frame = self._next_frame()
+            except RuntimeError as ex:
+                logger.error('Aborting connection: %s', ex)
+                self.reset()
+                self.transport.abort()
+                return
+            if frame is None:
                 # not enough data in the buffer
                 break
+            packet, payload = frame
             handler = self._deserializers.get(packet, lambda x: x)
             args = handler(payload)
             cb = self.get_registered(packet)
@@ -145,12 +315,34 @@ class GearmanProtocolMixin:
                 cb(packet, args)
             else:
                 logger.warning('Received un-expected message from server: %s (%r)', packet, args)
-            self._data = self._data[offset:]
+        self._compact()
 
-    def _send(self, data):
-        if self.transport:
-            self.transport.write(data)
+    def _send(self, *chunks):
+        if not self.transport:
+            return
+        self._outgoing.extend(chunks)
+        self._outgoing_size += sum(len(chunk) for chunk in chunks)
+        if not self.loop.is_running() or self._outgoing_size >= (self.high_water or self._default_high_water):
+            # Large bursts go to the transport right away, so it could pause us
+            self._flush_writes()
+        elif self._flush_handle is None:
+            self._flush_handle = self.loop.call_soon(self._flush_writes)
+
+    def _flush_writes(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        outgoing, self._outgoing = self._outgoing, []
+        self._outgoing_size = 0
+        if not outgoing or not self.transport:
+            return
+        if len(outgoing) == 1:
+            self.transport.write(outgoing[0])
+        elif self.loop.is_running():
+            self.transport.writelines(outgoing)
+        else:
+            self.transport.write(b''.join(outgoing))
 
     def send(self, packet, *args):
-        data = self.serialize_request(packet, *args)
-        self._send(data)
+        payload = self.serializer(packet)(*args)
+        self._send(*self._pack_chunks(self._REQ_MAGIC, packet, payload))
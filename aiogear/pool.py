@@ -0,0 +1,225 @@
+import bisect
+import asyncio
+import hashlib
+import logging
+import itertools
+from collections import OrderedDict
+from functools import partial
+from aiogear.packet import Type
+from aiogear.client import Client
+
+logger = logging.getLogger(__name__)
+
+
+class _PooledClient(Client):
+    def __init__(self, pool, server, **kwargs):
+        super(_PooledClient, self).__init__(**kwargs)
+        self.pool = pool
+        self.server = server
+
+    def connection_lost(self, exc):
+        super(_PooledClient, self).connection_lost(exc)
+        self.pool._connection_lost(self, exc)
+
+
+class ClientPool:
+    """
+    Client connections to a cluster of gearman servers. Jobs are routed by
+    consistent hashing on their uuid, so submitting the same unique job
+    always ends up on the same server while it is available. Servers number
+    their handles independently, so the pool hands out handles qualified
+    with the server, `<handle>@<host>:<port>`, and remembers them with the
+    connection they were created on; status requests and waiting for a job
+    go back to it. Servers without a live connection are skipped and
+    reconnected in the background.
+    """
+    def __init__(self, servers, connections=1, loop=None, replicas=64, retry_interval=1,
+                 max_handles=100000, **client_kwargs):
+        self.loop = loop or asyncio.get_event_loop()
+        self.servers = [self._parse_server(server) for server in servers]
+        if not self.servers:
+            raise RuntimeError('At least one server is required')
+        self.connections = connections
+        self.retry_interval = retry_interval
+        self.max_handles = max_handles
+        self.client_kwargs = client_kwargs
+        self.clients = {server: [] for server in self.servers}
+        self.reconnecting = {}
+        self.handles = OrderedDict()
+        self.closed = False
+        self._turns = itertools.count()
+
+        ring = sorted(
+            (self._hash('{}:{}-{}'.format(host, port, i)), (host, port))
+            for host, port in self.servers for i in range(replicas))
+        self._ring_keys = [key for key, _ in ring]
+        self._ring_servers = [server for _, server in ring]
+
+        self.submit_job = partial(self._submit_job, Type.SUBMIT_JOB)
+        self.submit_job_bg = partial(self._submit_job, Type.SUBMIT_JOB_BG)
+        self.submit_job_high = partial(self._submit_job, Type.SUBMIT_JOB_HIGH)
+        self.submit_job_high_bg = partial(self._submit_job, Type.SUBMIT_JOB_HIGH_BG)
+        self.submit_job_low = partial(self._submit_job, Type.SUBMIT_JOB_LOW)
+        self.submit_job_low_bg = partial(self._submit_job, Type.SUBMIT_JOB_LOW_BG)
+
+    @staticmethod
+    def _parse_server(server):
+        if isinstance(server, str):
+            host, _, port = server.rpartition(':')
+            return host or '127.0.0.1', int(port or 4730)
+        host, port = server
+        return host, int(port)
+
+    @staticmethod
+    def _hash(key):
+        if isinstance(key, str):
+            key = key.encode('utf8')
+        return int.from_bytes(hashlib.md5(key).digest()[:8], 'big')
+
+    async def connect(self):
+        """
+        Opens the connections to every server. Servers which can't be reached
+        are retried in the background, only failing to reach all of them is
+        an error.
+        """
+        attempts = [(server, self._connect_one(server)) for server in self.servers for _ in range(self.connections)]
+        results = await asyncio.gather(*[attempt for _, attempt in attempts], return_exceptions=True)
+        for (server, _), result in zip(attempts, results):
+            if isinstance(result, Exception):
+                logger.warning('Unable to connect to %s:%d: %s', server[0], server[1], result)
+                self._schedule_reconnect(server)
+        if not self.healthy():
+            raise RuntimeError('Unable to connect to any of the servers')
+
+    async def _connect_one(self, server):
+        host, port = server
+        client = _PooledClient(self, server, loop=self.loop, **self.client_kwargs)
+        await self.loop.create_connection(lambda: client, host, port)
+        self.clients[server].append(client)
+        return client
+
+    def _connection_lost(self, client, exc):
+        clients = self.clients[client.server]
+        if client in clients:
+            clients.remove(client)
+        if not self.closed:
+            logger.warning('Connection to %s:%d is lost (%s)', client.server[0], client.server[1], exc)
+            self._schedule_reconnect(client.server)
+
+    def _schedule_reconnect(self, server):
+        if not self.closed and server not in self.reconnecting:
+            self.reconnecting[server] = asyncio.ensure_future(self._reconnect(server), loop=self.loop)
+
+    async def _reconnect(self, server):
+        try:
+            while not self.closed and len(self.clients[server]) < self.connections:
+                await asyncio.sleep(self.retry_interval)
+                try:
+                    await self._connect_one(server)
+                except OSError as ex:
+                    logger.debug('Unable to reconnect to %s:%d: %s', server[0], server[1], ex)
+        finally:
+            self.reconnecting.pop(server, None)
+
+    def healthy(self):
+        return [server for server in self.servers if self._live(server)]
+
+    def _live(self, server):
+        return [client for client in self.clients[server] if client.transport]
+
+    def server_for(self, uuid):
+        """
+        Returns the first available server clockwise from the uuid on the
+        hash ring.
+        """
+        start = bisect.bisect(self._ring_keys, self._hash(uuid))
+        size = len(self._ring_servers)
+        for i in range(size):
+            server = self._ring_servers[(start + i) % size]
+            if self._live(server):
+                return server
+        raise RuntimeError('None of the servers is available')
+
+    def _client_for(self, uuid):
+        clients = self._live(self.server_for(uuid))
+        return clients[next(self._turns) % len(clients)]
+
+    def _client_of(self, token):
+        try:
+            client, handle = self.handles[token]
+        except KeyError:
+            raise RuntimeError('Unable to find handle {}'.format(token))
+        if not client.transport:
+            raise RuntimeError('Server {}:{} of handle {} is not available'.format(
+                client.server[0], client.server[1], token))
+        return client, handle
+
+    def _remember(self, handle, client):
+        token = '{}@{}:{}'.format(handle, *client.server)
+        self.handles[token] = (client, handle)
+        self.handles.move_to_end(token)
+        while len(self.handles) > self.max_handles:
+            self.handles.popitem(last=False)
+        return token
+
+    def _qualified(self, f, token):
+        # Responses carry the qualified handle the job is known by in the pool
+        qualified = self.loop.create_future()
+
+        def done(_):
+            if qualified.done():
+                return
+            if f.cancelled():
+                qualified.cancel()
+            elif f.exception() is not None:
+                qualified.set_exception(f.exception())
+            else:
+                qualified.set_result(f.result()._replace(handle=token))
+
+        f.add_done_callback(done)
+        return qualified
+
+    async def _submit_job(self, packet, name, *args, **kwargs):
+        uuid = kwargs.pop('uuid', None)
+        if uuid is None:
+            uuid = Client.uuid()
+        client = self._client_for(uuid)
+        job_created = await client._submit_job(packet, name, *args, uuid=uuid, **kwargs)
+        return job_created._replace(handle=self._remember(job_created.handle, client))
+
+    def submit_job_sched(self, name, dt, *args, **kwargs):
+        sched_args = [str(int(x)) for x in dt.strftime('%M %H %d %m %w').split()]
+        return self._submit_job(Type.SUBMIT_JOB_SCHED, name, *(sched_args + list(args)), **kwargs)
+
+    def get_status(self, token):
+        client, handle = self._client_of(token)
+        return self._qualified(client.get_status(handle), token)
+
+    def get_status_unique(self, uuid):
+        return self._client_for(uuid).get_status_unique(uuid)
+
+    def wait_job(self, token):
+        client, handle = self._client_of(token)
+        return self._qualified(client.wait_job(handle), token)
+
+    async def stream(self, token):
+        client, handle = self._client_of(token)
+        async for update in client.stream(handle):
+            yield update._replace(handle=token)
+
+    async def close(self):
+        self.closed = True
+        for task in list(self.reconnecting.values()):
+            task.cancel()
+        closing = [client.close() for clients in self.clients.values() for client in clients if client.transport]
+        if closing:
+            await asyncio.wait(closing)
+
+    disconnect = close
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
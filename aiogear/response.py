@@ -7,6 +7,8 @@ JobAssignUniq = namedtuple('JobAssignUniq', ['handle', 'function', 'uuid', 'work
 JobAssignAll = namedtuple('JobAssignAll', ['handle', 'function', 'uuid', 'reducer', 'workload'])
 WorkComplete = namedtuple('WorkComplete', ['handle', 'result'])
 WorkData = namedtuple('WorkData', ['handle', 'data'])
+WorkWarning = namedtuple('WorkWarning', ['handle', 'data'])
+WorkStatus = namedtuple('WorkStatus', ['handle', 'numerator', 'denominator'])
 WorkFail = namedtuple('WorkFail', ['handle'])
 WorkException = namedtuple('WorkException', ['handle', 'exception'])
 NoJob = namedtuple('NoJob', [])
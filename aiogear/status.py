@@ -0,0 +1,84 @@
+import asyncio
+from collections import OrderedDict, Counter
+
+
+class StatusTracker:
+    """
+    Polls the status of many jobs, by handle or by uuid, and yields their
+    StatusRes (StatusResUnique for uuids) whenever it changes. Requests for
+    up to `batch` jobs are pipelined at once, a round over all of them
+    starts every `interval` seconds. Jobs gearmand doesn't know (anymore)
+    are finished and dropped once their last status is yielded.
+    """
+    def __init__(self, client, handles=(), uuids=(), interval=1, batch=1000):
+        if batch < 1:
+            raise RuntimeError('batch must be at least 1')
+        self.client = client
+        self.loop = client.loop
+        self.interval = interval
+        self.batch = batch
+        # Last status by (unique, handle or uuid)
+        self.tracked = OrderedDict()
+        self.stats = Counter()
+        self._stopped = False
+        for handle in handles:
+            self.track(handle)
+        for uuid in uuids:
+            self.track_unique(uuid)
+
+    def __len__(self):
+        return len(self.tracked)
+
+    def __aiter__(self):
+        return self.changes()
+
+    def track(self, handle):
+        self.tracked.setdefault((False, handle), None)
+
+    def track_unique(self, uuid):
+        self.tracked.setdefault((True, uuid), None)
+
+    def untrack(self, handle_or_uuid):
+        self.tracked.pop((False, handle_or_uuid), None)
+        self.tracked.pop((True, handle_or_uuid), None)
+
+    def stop(self):
+        self._stopped = True
+
+    def _request(self, unique, key):
+        if unique:
+            return self.client.get_status_unique(key)
+        return self.client.get_status(key)
+
+    async def poll(self, keys):
+        """
+        Requests the status of `keys` in one go and returns the ones which
+        changed.
+        """
+        self.stats['requests'] += len(keys)
+        responses = await asyncio.gather(*[self._request(*key) for key in keys])
+        changed = []
+        for key, status in zip(keys, responses):
+            if key not in self.tracked:
+                # Untracked while waiting for the response
+                continue
+            if status != self.tracked[key]:
+                changed.append(status)
+            if status.known:
+                self.tracked[key] = status
+            else:
+                del self.tracked[key]
+        return changed
+
+    async def changes(self):
+        while self.tracked and not self._stopped:
+            started = self.loop.time()
+            keys = list(self.tracked)
+            for i in range(0, len(keys), self.batch):
+                for status in await self.poll(keys[i:i + self.batch]):
+                    self.stats['changes'] += 1
+                    yield status
+                if self._stopped:
+                    return
+            if self.tracked:
+                await asyncio.sleep(max(self.interval - (self.loop.time() - started), 0))
@@ -0,0 +1,222 @@
+"""
+Prefork supervisor running the same worker functions in several processes.
+
+Each child process opens a number of reconnecting worker connections on its
+own event loop. Crashed children are restarted, SIGTERM/SIGINT are forwarded to the
+children as a graceful worker shutdown and per-process job counts are
+reported periodically.
+
+    aiogear-worker -a 127.0.0.1 -p 4730 -w 8 -c 2 mypackage.jobs:reverse
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import logging
+import argparse
+import importlib
+import multiprocessing
+from queue import Empty
+from collections import Counter
+from aiogear.worker import ManagedWorker, ExecutionMode
+
+logger = logging.getLogger(__name__)
+
+
+def load_function(spec):
+    module_name, _, attr = spec.partition(':')
+    if not module_name or not attr:
+        raise argparse.ArgumentTypeError(
+            'Function must be given as module:function, got {!r}'.format(spec))
+    try:
+        obj = importlib.import_module(module_name)
+        for name in attr.split('.'):
+            obj = getattr(obj, name)
+    except (ImportError, AttributeError) as ex:
+        raise argparse.ArgumentTypeError('Unable to load {}: {}'.format(spec, ex))
+    return obj
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        prog='aiogear-worker', description='Run gearman worker functions in several processes.')
+    parser.add_argument('functions', nargs='+', metavar='module:function',
+                        help='Functions to register, e.g. mypackage.jobs:reverse')
+    parser.add_argument('-a', '--addr', default='127.0.0.1', help='Gearman host address.')
+    parser.add_argument('-p', '--port', default=4730, type=int, help='Gearman port number.')
+    parser.add_argument('-w', '--processes', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes, defaults to the number of cores.')
+    parser.add_argument('-c', '--connections', type=int, default=1,
+                        help='Number of worker connections per process.')
+    parser.add_argument('--max-in-flight', type=int, default=1,
+                        help='Number of concurrent jobs per connection.')
+    parser.add_argument('--eager', action='store_true', help='Grab jobs without sleeping in between.')
+    parser.add_argument('--mode', default=ExecutionMode.INLINE.value,
+                        choices=[mode.value for mode in ExecutionMode],
+                        help='Where plain functions are run.')
+    parser.add_argument('--timeout', type=int, default=None, help='Job timeout announced to the daemon.')
+    parser.add_argument('--report-interval', type=float, default=60,
+                        help='Seconds between job count reports.')
+    parser.add_argument('--restart-delay', type=float, default=1,
+                        help='Seconds to wait before restarting a crashed process.')
+    parser.add_argument('--grace', type=float, default=30,
+                        help='Seconds to wait for processes to finish their jobs on shutdown.')
+    parser.add_argument('--log-level', default='INFO', help='Logging level.')
+    return parser.parse_args(args)
+
+
+def _create_worker(args, functions, loop):
+    return ManagedWorker(
+        *functions, host=args.addr, port=args.port, loop=loop, timeout=args.timeout,
+        max_in_flight=args.max_in_flight, eager=args.eager, mode=args.mode)
+
+
+def _format_counts(counts):
+    counts = Counter(dict.fromkeys(['complete', 'exception', 'fail', 'reconnects'], 0), **counts)
+    return ', '.join('{}={}'.format(key, value) for key, value in sorted(counts.items()))
+
+
+def _totals(workers):
+    totals = Counter()
+    for worker in workers:
+        totals.update(worker.stats)
+    return dict(totals)
+
+
+async def serve(args, index, reports, loop):
+    functions = [load_function(spec) for spec in args.functions]
+    workers = [_create_worker(args, functions, loop) for _ in range(args.connections)]
+    stopping = loop.create_future()
+    loop.add_signal_handler(signal.SIGTERM, lambda: stopping.done() or stopping.set_result(True))
+    # Workers reconnect by themselves, a daemon restart doesn't need a new process
+    connecting = asyncio.gather(*[worker.connect() for worker in workers])
+    while not stopping.done():
+        await asyncio.wait([stopping], timeout=args.report_interval)
+        reports.put((index, os.getpid(), _totals(workers)))
+
+    connecting.cancel()
+    await asyncio.gather(connecting, return_exceptions=True)
+    await asyncio.gather(*[worker.shutdown(graceful=True) for worker in workers])
+    reports.put((index, os.getpid(), _totals(workers)))
+
+
+def run_child(args, index, reports):
+    # The supervisor decides when to stop, Ctrl-C hits the whole process group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(serve(args, index, reports, loop))
+    finally:
+        loop.close()
+
+
+class Supervisor:
+    def __init__(self, args):
+        self.args = args
+        try:
+            self.context = multiprocessing.get_context('fork')
+        except ValueError:
+            self.context = multiprocessing.get_context()
+        self.reports = self.context.Queue()
+        self.children = {}
+        self.restart_at = {}
+        self.job_counts = {}
+        self.restarts = Counter()
+        self.stopping = False
+
+    def spawn(self, index):
+        process = self.context.Process(
+            target=run_child, args=(self.args, index, self.reports), name='aiogear-worker-{}'.format(index))
+        process.start()
+        logger.info('Started worker process %d (pid %d)', index, process.pid)
+        self.children[index] = process
+
+    def stop(self, *_):
+        if not self.stopping:
+            logger.info('Shutting down worker processes...')
+        self.stopping = True
+
+    def check_children(self):
+        now = time.monotonic()
+        for index, process in list(self.children.items()):
+            if process.is_alive():
+                continue
+            restart_at = self.restart_at.get(index)
+            if restart_at is None:
+                logger.warning('Worker process %d (pid %d) exited with %s, restarting',
+                               index, process.pid, process.exitcode)
+                self.restarts[index] += 1
+                self.restart_at[index] = now + self.args.restart_delay
+            elif now >= restart_at:
+                del self.restart_at[index]
+                self.spawn(index)
+
+    def collect_reports(self, timeout):
+        try:
+            index, pid, counts = self.reports.get(timeout=timeout)
+        except Empty:
+            return
+        self.job_counts[index] = (pid, counts)
+        while True:
+            try:
+                index, pid, counts = self.reports.get_nowait()
+            except Empty:
+                break
+            self.job_counts[index] = (pid, counts)
+
+    def report(self):
+        totals = Counter()
+        for index, (pid, counts) in sorted(self.job_counts.items()):
+            totals.update(counts)
+            logger.info('Worker process %d (pid %d, %d restarts): %s', index, pid,
+                        self.restarts[index], _format_counts(counts))
+        logger.info('Total: %s', _format_counts(totals))
+
+    def shutdown(self):
+        for process in self.children.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self.args.grace
+        for process in self.children.values():
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning('Worker process (pid %d) did not stop in time, killing', process.pid)
+                process.kill()
+                process.join()
+        self.collect_reports(timeout=0.1)
+        self.report()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.args.processes):
+            self.spawn(index)
+
+        next_report = time.monotonic() + self.args.report_interval
+        while not self.stopping:
+            self.collect_reports(timeout=0.2)
+            self.check_children()
+            if time.monotonic() >= next_report:
+                self.report()
+                next_report += self.args.report_interval
+        self.shutdown()
+
+
+def main(args=None):
+    args = parse_args(args)
+    logging.basicConfig(
+        level=args.log_level.upper(), format='%(asctime)s %(process)d %(levelname)s %(name)s: %(message)s')
+    # Fail early on unknown functions rather than in every child
+    try:
+        for spec in args.functions:
+            load_function(spec)
+    except argparse.ArgumentTypeError as ex:
+        sys.exit('aiogear-worker: {}'.format(ex))
+    Supervisor(args).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,80 @@
+import random
+import inspect
 import asyncio
 import logging
-from collections import namedtuple, OrderedDict
-from weakref import WeakValueDictionary
-from functools import partial
+from enum import Enum
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import namedtuple, OrderedDict, Counter, defaultdict
 from aiogear.packet import Type
 from aiogear.mixin import GearmanProtocolMixin
 from aiogear.response import NoJob
+from aiogear.budget import Budget
 
 logger = logging.getLogger(__name__)
 
 
 JobInfo = namedtuple('JobInfo', ['handle', 'function', 'uuid', 'reducer', 'workload'])
+# Yielded by generator functions to report WORK_STATUS rather than WORK_DATA
+Progress = namedtuple('Progress', ['numerator', 'denominator'])
+# Batch functions get up to `size` jobs at once, waiting at most `wait` seconds to fill it
+Batch = namedtuple('Batch', ['size', 'wait'])
+
+
+_MISS = object()
+
+
+class _Expired(Exception):
+    # A job outlived its deadline, unlike a TimeoutError raised by the job
+    pass
+
+
+class ExecutionMode(Enum):
+    INLINE = 'inline'
+    THREAD = 'thread'
+    PROCESS = 'process'
 
 
 class Worker(GearmanProtocolMixin, asyncio.Protocol):
-    def __init__(self, *functions, loop=None, grab_type=Type.GRAB_JOB, timeout=None):
-        super(Worker, self).__init__(loop=loop)
+    def __init__(self, *functions, loop=None, grab_type=Type.GRAB_JOB, timeout=None, max_in_flight=1,
+                 eager=False, mode=ExecutionMode.INLINE, thread_pool_size=None, process_pool_size=None,
+                 batches=None, raw=False, codec=None, high_water=None, low_water=None, max_buffer_size=None,
+                 budget=None, weight=1, dedup=None, timeouts=None):
+        # Codecs work on the undecoded payloads
+        super(Worker, self).__init__(
+            loop=loop, raw=raw or codec is not None, high_water=high_water, low_water=low_water,
+            max_buffer_size=max_buffer_size)
+        self.codec = codec
         self.transport = None
         self.main_task = None
         self.functions = OrderedDict()
-        self.running = WeakValueDictionary()
+        self.modes = {}
+        self.batches = {}
+        self.pending = {}
+        self.batch_stats = defaultdict(Counter)
+        self.executors = {}
+        self.running = {}
+        self.stats = Counter()
         self.waiters = []
         self.shutting_down = False
         self.timeout = timeout
+        # Per function deadlines, overriding timeout
+        self.timeouts = dict(timeouts or {})
+
+        if max_in_flight < 1:
+            raise RuntimeError('max_in_flight must be at least 1')
+        self.max_in_flight = max_in_flight
+        # Shared with other workers, every grabbed job holds one of its slots
+        self.budget = budget
+        if budget is not None:
+            budget.register(self, weight)
+        self.eager = eager
+        # Results of unique jobs by (function, uuid), repeats are answered from it
+        self.dedup = dedup
+        self.mode = ExecutionMode(mode)
+        self.pool_sizes = {
+            ExecutionMode.THREAD: thread_pool_size,
+            ExecutionMode.PROCESS: process_pool_size,
+        }
 
         grab_mapping = {
             Type.GRAB_JOB: self.grab_job,
@@ -38,104 +90,393 @@ class Worker(GearmanProtocolMixin, asyncio.Protocol):
 
         for func_arg in functions:
             try:
-                func, name = func_arg
-                self.functions[name] = func
+                func, name, *mode = func_arg
             except TypeError:
-                name = func_arg.__name__
-                self.functions[name] = func_arg
+                func, name, mode = func_arg, func_arg.__name__, []
+            self._add_function(func, name, *mode)
+
+        for name, batch in (batches or {}).items():
+            self.batches[name] = Batch(*batch)
 
     def connection_made(self, transport):
         logger.info('Connection is made to %r', transport.get_extra_info('peername'))
-        self.transport = transport
-
-        if self.timeout is not None:
-            can_do = partial(self.can_do_timeout, timeout=self.timeout)
-        else:
-            can_do = self.can_do
+        super(Worker, self).connection_made(transport)
 
         for fname in self.functions.keys():
             logger.debug('Registering function %s', fname)
-            can_do(fname)
+            self._can_do(fname)
         self.main_task = self.get_task(self.run())
 
     def connection_lost(self, exc):
-        self.transport = None
+        super(Worker, self).connection_lost(exc)
+        if self.main_task:
+            self.main_task.cancel()
+        self.reset()
+        # Results can't be delivered anymore, the daemon hands the jobs to
+        # another worker.
+        aborted = list(self.running.values())
+        for task in aborted:
+            task.cancel()
+        self.stats['aborted'] += len(aborted) + self.drop_pending()
+        if not self.shutting_down:
+            logger.warning('Connection is lost (%s), %d running jobs aborted', exc, len(aborted))
 
     def get_task(self, coro):
         return asyncio.ensure_future(coro, loop=self.loop)
 
     async def run(self,):
         no_job = NoJob()
+        # Eager workers only go to sleep once the queue is drained
+        sleep = not self.eager
         while not self.shutting_down:
-            self.pre_sleep()
-            await self.wait_for(Type.NOOP)
-            response = await self.grab()
+            await self.wait_for_slot()
+            # No new jobs while their results can't be sent
+            await self.drain()
+            if sleep:
+                self.pre_sleep()
+                await self.wait_for(Type.NOOP)
+            if self.budget is not None:
+                await self.budget.acquire(self)
+            try:
+                response = await self.grab()
+            except asyncio.CancelledError:
+                self.release()
+                raise
             if response == no_job:
+                # Idle servers don't keep capacity from the busy ones
+                self.release()
+                sleep = True
                 continue
+            sleep = not self.eager
 
             try:
                 job_info = self._to_job_info(response)
-                func = self.functions.get(job_info.function)
-                if not func:
-                    logger.warning(
-                        'Failed to find function %s in %s', job_info.function,
-                        ', '.join(self.functions.keys()))
-                    self.work_fail(job_info.handle)
+            except AttributeError:
+                logger.error('Unexpected GRAB_JOB response %r', response)
+                self.release()
+                continue
+
+            func = self.functions.get(job_info.function)
+            if not func:
+                logger.warning(
+                    'Failed to find function %s in %s', job_info.function,
+                    ', '.join(self.functions.keys()))
+                self.stats['fail'] += 1
+                self.work_fail(job_info.handle)
+                self.release()
+                continue
+
+            if self.dedup is not None and job_info.uuid:
+                result = self.dedup.get((job_info.function, job_info.uuid), _MISS)
+                if result is not _MISS:
+                    try:
+                        self.work_complete(job_info.handle, result)
+                    except Exception as ex:
+                        logger.exception('Unable to replay result of job (handle %s)', job_info.handle)
+                        self.stats['exception'] += 1
+                        self.work_exception(job_info.handle, str(ex))
+                    else:
+                        self.stats['dedup_hits'] += 1
+                    self.release()
                     continue
 
-                try:
-                    result_or_coro = func(job_info)
-                    if asyncio.iscoroutine(result_or_coro):
-                        task = self.get_task(result_or_coro)
-                        self.running[job_info.handle] = task
-                        result = await task
+            try:
+                job_info = self.decode(job_info)
+            except Exception as ex:
+                logger.exception('Unable to decode workload of job (handle %s)', job_info.handle)
+                self.stats['exception'] += 1
+                self.work_exception(job_info.handle, str(ex))
+                self.release()
+                continue
+
+            if job_info.function in self.batches:
+                self.add_to_batch(func, job_info)
+            else:
+                task = self.running[job_info.handle] = self.get_task(self.run_job(func, job_info))
+                task.add_done_callback(lambda _: self.release())
+
+    def release(self, count=1):
+        if self.budget is not None and count:
+            self.budget.release(count)
+
+    def in_flight(self):
+        return len(self.running) + sum(len(jobs) for _, jobs in self.pending.values())
+
+    async def wait_for_slot(self):
+        while self.in_flight() >= self.max_in_flight:
+            if not self.running:
+                # Only half filled batches are holding the slots
+                self.flush_all()
+            await asyncio.wait(list(self.running.values()), return_when=asyncio.FIRST_COMPLETED)
+
+    def add_to_batch(self, func, job_info):
+        name = job_info.function
+        batch = self.batches[name]
+        if name not in self.pending:
+            timer = self.loop.call_later(batch.wait, self.flush, name)
+            self.pending[name] = (timer, [])
+        _, jobs = self.pending[name]
+        jobs.append(job_info)
+        if len(jobs) >= batch.size or self.in_flight() >= self.max_in_flight:
+            self.flush(name)
+
+    def flush(self, name):
+        timer, jobs = self.pending.pop(name)
+        timer.cancel()
+        batch = self.batches[name]
+        stats = self.batch_stats[name]
+        stats['batches'] += 1
+        stats['jobs'] += len(jobs)
+        if len(jobs) >= batch.size:
+            stats['full'] += 1
+        stats['fill_time'] += max(0, batch.wait - (timer.when() - self.loop.time()))
+
+        task = self.get_task(self.run_batch(self.functions[name], name, jobs))
+        task.add_done_callback(lambda _: self.release(len(jobs)))
+        for job_info in jobs:
+            self.running[job_info.handle] = task
+
+    def flush_all(self):
+        for name in list(self.pending):
+            self.flush(name)
+
+    def drop_pending(self):
+        dropped = 0
+        for timer, jobs in self.pending.values():
+            timer.cancel()
+            dropped += len(jobs)
+        self.pending.clear()
+        self.release(dropped)
+        return dropped
+
+    async def run_batch(self, func, name, jobs):
+        timeout = self.job_timeout(name)
+        try:
+            results = await self.within(self.execute_batch(func, name, jobs), timeout)
+        except asyncio.CancelledError:
+            raise
+        except _Expired:
+            logger.warning('Batch of %d jobs (function %s) exceeded its %ss deadline', len(jobs), name, timeout)
+            results = None
+        except Exception as ex:
+            logger.exception('Batch of %d jobs (function %s) resulted with exception', len(jobs), name)
+            results = [ex] * len(jobs)
+
+        try:
+            if results is None:
+                self.stats['timeouts'] += len(jobs)
+                for job_info in jobs:
+                    self.work_fail(job_info.handle)
+                return
+            for job_info, result in zip(jobs, results):
+                if not isinstance(result, Exception):
+                    try:
+                        result = self.encode(result)
+                        self.work_complete(job_info.handle, result)
+                    except Exception as ex:
+                        logger.exception('Unable to send result of job (handle %s)', job_info.handle)
+                        result = ex
                     else:
-                        result = result_or_coro
-                    self.work_complete(job_info.handle, result)
-                except Exception as ex:
-                    logger.exception('Job (handle %s) resulted with exception', job_info.handle)
-                    self.work_exception(job_info.handle, str(ex))
-                finally:
-                    self.running.pop(job_info.handle, None)
+                        self.stats['complete'] += 1
+                        self.remember(job_info, result)
+                        continue
+                self.stats['exception'] += 1
+                self.work_exception(job_info.handle, str(result))
+        finally:
+            for job_info in jobs:
+                self.running.pop(job_info.handle, None)
 
-            except AttributeError:
-                logger.error('Unexpected GRAB_JOB response %r', response)
+    async def execute_batch(self, func, name, jobs):
+        mode = self.modes.get(name, self.mode)
+        if mode is ExecutionMode.INLINE:
+            results = func(jobs)
+            if asyncio.iscoroutine(results):
+                results = await results
+        else:
+            results = await self.loop.run_in_executor(
+                self.get_executor(mode), func, [self._detached(job_info, mode) for job_info in jobs])
+        results = list(results)
+        if len(results) != len(jobs):
+            raise RuntimeError('Batch function {} returned {} results for {} jobs'.format(
+                name, len(results), len(jobs)))
+        return results
+
+    async def run_job(self, func, job_info):
+        timeout = self.job_timeout(job_info.function)
+        try:
+            result, streamed = await self.within(self.execute(func, job_info), timeout)
+            result = self.encode(result)
+            self.work_complete(job_info.handle, result)
+            self.stats['complete'] += 1
+            # Only results gearmand accepted are replayed, replaying only the
+            # final result would lose the streamed chunks.
+            if not streamed:
+                self.remember(job_info, result)
+        except asyncio.CancelledError:
+            raise
+        except _Expired:
+            # Jobs running in an executor can't be interrupted, they carry
+            # on but their result is dropped.
+            logger.warning('Job (handle %s) exceeded its %ss deadline', job_info.handle, timeout)
+            self.stats['timeouts'] += 1
+            self.work_fail(job_info.handle)
+        except Exception as ex:
+            logger.exception('Job (handle %s) resulted with exception', job_info.handle)
+            self.stats['exception'] += 1
+            self.work_exception(job_info.handle, str(ex))
+        finally:
+            self.running.pop(job_info.handle, None)
+
+    async def execute(self, func, job_info):
+        mode = self.modes.get(job_info.function, self.mode)
+        streamed = False
+        if mode is ExecutionMode.INLINE:
+            result = func(job_info)
+            if inspect.isasyncgen(result):
+                streamed = True
+                result = await self.stream_async(job_info.handle, result)
+            elif inspect.isgenerator(result) and not asyncio.iscoroutinefunction(func):
+                # Plain generator, not a generator based coroutine
+                streamed = True
+                result = self.stream(job_info.handle, result)
+            elif asyncio.iscoroutine(result):
+                result = await result
+        else:
+            result = await self.loop.run_in_executor(
+                self.get_executor(mode), func, self._detached(job_info, mode))
+        return result, streamed
+
+    async def within(self, coro, timeout):
+        """
+        Awaits `coro`, raising _Expired and cancelling it if it doesn't
+        finish in `timeout` seconds. Its own exceptions pass through as is.
+        """
+        if timeout is None:
+            return await coro
+        task = self.get_task(coro)
+        try:
+            done, _ = await asyncio.wait([task], timeout=timeout)
+        finally:
+            if not task.done():
+                task.cancel()
+        if not done:
+            raise _Expired
+        return task.result()
+
+    def job_timeout(self, name):
+        return self.timeouts.get(name, self.timeout)
+
+    async def stream_async(self, handle, chunks):
+        async for chunk in chunks:
+            self.send_chunk(handle, chunk)
+            await self.drain()
+
+    def stream(self, handle, chunks):
+        for chunk in chunks:
+            self.send_chunk(handle, chunk)
+
+    def send_chunk(self, handle, chunk):
+        if isinstance(chunk, Progress):
+            self.work_status(handle, *chunk)
+        else:
+            self.work_data(handle, self.encode(chunk))
+
+    def decode(self, job_info):
+        if self.codec is None:
+            return job_info
+        return job_info._replace(workload=self.codec.decode(job_info.workload))
+
+    def remember(self, job_info, result):
+        if self.dedup is not None and job_info.uuid:
+            if isinstance(result, memoryview):
+                result = result.tobytes()
+            self.dedup.set((job_info.function, job_info.uuid), '' if result is None else result)
+        return result
+
+    def encode(self, result):
+        if self.codec is None:
+            return result
+        return self.codec.encode(result)
 
     async def shutdown(self, graceful=False):
         logger.debug('Shutting down worker {}gracefully...'.format('' if graceful else 'un'))
         self.shutting_down = True
-        sub_tasks = list(self.running.values())
+        # Stop grabbing before the in-flight jobs are drained or cancelled
+        if self.main_task:
+            self.main_task.cancel()
         if graceful:
-            if sub_tasks:
-                await asyncio.wait(sub_tasks, loop=self.loop)
+            self.flush_all()
+            while self.running:
+                await asyncio.wait(list(self.running.values()))
         else:
             async def cancel_and_wait(tasks):
                 for task in tasks:
                     task.cancel()
                 try:
-                    await asyncio.wait(tasks, loop=self.loop)
+                    await asyncio.wait(tasks)
                 except asyncio.CancelledError:
                     pass
+            for _, jobs in self.pending.values():
+                for job_info in jobs:
+                    self.work_fail(job_info.handle)
+            self.stats['fail'] += self.drop_pending()
+            sub_tasks = list(self.running.values())
             if sub_tasks:
                 await cancel_and_wait(sub_tasks)
-        self.main_task.cancel()
+
+        for executor in self.executors.values():
+            executor.shutdown(wait=False)
+        self.executors.clear()
 
         if self.transport:
+            self._flush_writes()
             self.transport.close()
 
+    @staticmethod
+    def _detached(job_info, mode):
+        # memoryviews can't be pickled over to a process pool
+        if mode is ExecutionMode.PROCESS and isinstance(job_info.workload, memoryview):
+            return job_info._replace(workload=job_info.workload.tobytes())
+        return job_info
+
     @staticmethod
     def _to_job_info(job_assign):
         attrs = ['handle', 'function', 'uuid', 'reducer', 'workload']
         values = [getattr(job_assign, attr, None) for attr in attrs]
         return JobInfo(*values)
 
-    def register_function(self, func, name=''):
+    def register_function(self, func, name='', mode=None, batch_size=None, batch_wait=0.01):
         if not self.transport:
             raise RuntimeError('Worker must be connected to the daemon')
         name = name or func.__name__
-        self.functions[name] = func
+        self._add_function(func, name, mode)
+        if batch_size:
+            self.batches[name] = Batch(batch_size, batch_wait)
+        return self._can_do(name)
+
+    def _can_do(self, name):
+        timeout = self.job_timeout(name)
+        if timeout is not None:
+            return self.can_do_timeout(name, timeout)
         return self.can_do(name)
 
+    def _add_function(self, func, name, mode=None):
+        mode = ExecutionMode(mode or self.mode)
+        if mode is not ExecutionMode.INLINE and asyncio.iscoroutinefunction(func):
+            raise RuntimeError('Coroutine function {} can only be run inline'.format(name))
+        if inspect.isgeneratorfunction(func) or inspect.isasyncgenfunction(func):
+            # Chunks are sent as they are yielded, from the loop
+            mode = ExecutionMode.INLINE
+        self.functions[name] = func
+        self.modes[name] = mode
+
+    def get_executor(self, mode):
+        executor = self.executors.get(mode)
+        if executor is None:
+            pool = ThreadPoolExecutor if mode is ExecutionMode.THREAD else ProcessPoolExecutor
+            executor = self.executors[mode] = pool(self.pool_sizes[mode])
+        return executor
+
     def grab_job_all(self):
         self.send(Type.GRAB_JOB_ALL)
         return self.wait_for(Type.NO_JOB, Type.JOB_ASSIGN_ALL)
@@ -163,6 +504,15 @@ class Worker(GearmanProtocolMixin, asyncio.Protocol):
     def work_exception(self, handle, data):
         self.send(Type.WORK_EXCEPTION, handle, data)
 
+    def work_data(self, handle, data):
+        self.send(Type.WORK_DATA, handle, data)
+
+    def work_warning(self, handle, data):
+        self.send(Type.WORK_WARNING, handle, data)
+
+    def work_status(self, handle, numerator, denominator):
+        self.send(Type.WORK_STATUS, handle, numerator, denominator)
+
     def work_complete(self, handle, result):
         if result is None:
             result = ''
@@ -170,3 +520,95 @@ class Worker(GearmanProtocolMixin, asyncio.Protocol):
 
     def set_client_id(self, client_id):
         self.send(Type.SET_CLIENT_ID, client_id)
+
+
+class ManagedWorker(Worker):
+    """
+    Worker which connects to the daemon by itself and reconnects with a
+    jittered exponential backoff whenever the connection is lost. Functions
+    are registered again on every connection.
+    """
+    def __init__(self, *functions, host='127.0.0.1', port=4730, min_backoff=0.1, max_backoff=30, **kwargs):
+        super(ManagedWorker, self).__init__(*functions, **kwargs)
+        self.host = host
+        self.port = port
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.connecting = None
+        self.connected_once = False
+
+    def backoff(self, attempt):
+        delay = min(self.max_backoff, self.min_backoff * 2 ** min(attempt, 32))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def connect(self):
+        attempt = 0
+        while not self.shutting_down:
+            try:
+                await self.loop.create_connection(lambda: self, self.host, self.port)
+                return self
+            except OSError as ex:
+                self.stats['connect_failures'] += 1
+                delay = self.backoff(attempt)
+                attempt += 1
+                logger.warning('Unable to connect to %s:%s (%s), retrying in %.2f seconds',
+                               self.host, self.port, ex, delay)
+                await asyncio.sleep(delay)
+
+    def connection_made(self, transport):
+        if self.connected_once:
+            self.stats['reconnects'] += 1
+        self.connected_once = True
+        super(ManagedWorker, self).connection_made(transport)
+
+    def connection_lost(self, exc):
+        super(ManagedWorker, self).connection_lost(exc)
+        if not self.shutting_down:
+            self.connecting = self.get_task(self.connect())
+
+    async def shutdown(self, graceful=False):
+        self.shutting_down = True
+        if self.connecting:
+            self.connecting.cancel()
+        await super(ManagedWorker, self).shutdown(graceful=graceful)
+
+
+class WorkerGroup:
+    """
+    Reconnecting workers registering the same functions on several servers
+    and sharing one Budget of `capacity` jobs. Servers are given as
+    (host, port) or (host, port, weight) tuples; while the budget is
+    exhausted, freed slots go to the servers with jobs in proportion to their
+    weights. Workers of idle servers hold no slots while they sleep.
+    """
+    def __init__(self, *functions, servers=(('127.0.0.1', 4730),), capacity=1, loop=None, **kwargs):
+        self.loop = loop or asyncio.get_event_loop()
+        self.budget = Budget(capacity, loop=self.loop)
+        self.workers = []
+        for server in servers:
+            host, port, *weight = server
+            self.workers.append(ManagedWorker(
+                *functions, host=host, port=port, loop=self.loop, max_in_flight=capacity,
+                budget=self.budget, weight=weight[0] if weight else 1, **kwargs))
+        self.connecting = []
+
+    @property
+    def stats(self):
+        totals = Counter()
+        for worker in self.workers:
+            totals.update(worker.stats)
+        return totals
+
+    async def connect(self):
+        """
+        Connects every worker, returns once the first one is connected while
+        the others keep retrying.
+        """
+        self.connecting = [asyncio.ensure_future(worker.connect(), loop=self.loop) for worker in self.workers]
+        await asyncio.wait(self.connecting, return_when=asyncio.FIRST_COMPLETED)
+        return self
+
+    async def shutdown(self, graceful=False):
+        for task in self.connecting:
+            task.cancel()
+        await asyncio.gather(*[worker.shutdown(graceful=graceful) for worker in self.workers])
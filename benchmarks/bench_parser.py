@@ -0,0 +1,92 @@
+import sys
+import os.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+import struct
+import logging
+import argparse
+from aiogear.mixin import GearmanProtocolMixin
+from aiogear.packet import Type
+
+
+def parse_args():
+    args = sys.argv[1:]
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--number', type=int, default=10000, help='Number of jobs in the burst.')
+    parser.add_argument('-s', '--size', type=int, default=4 * 1024 * 1024, help='Size of the large workload.')
+    parser.add_argument('-c', '--chunk', type=int, default=64 * 1024, help='Size of each received chunk.')
+    return parser.parse_args(args)
+
+
+class LegacyProtocol(GearmanProtocolMixin):
+    """
+    Receive path as it was before the bytearray parser: the whole remaining
+    buffer is copied once per frame.
+    """
+    _data = b''
+
+    def _unpack(self, data):
+        fmt = '>4sII'
+        fmt_sz = struct.calcsize(fmt)
+        magic, packet_num, sz = struct.unpack(fmt, data[:fmt_sz])
+        begin, end = fmt_sz, fmt_sz + sz
+        if len(data) < end:
+            raise RuntimeError
+        return Type(packet_num), data[begin:end], end
+
+    def data_received(self, data):
+        self._data += data
+        while self._data:
+            try:
+                packet, payload, offset = self._unpack(self._data)
+            except (struct.error, RuntimeError):
+                break
+            handler = self._deserializers.get(packet, lambda x: x)
+            args = handler(payload)
+            cb = self.get_registered(packet)
+            if cb:
+                cb(packet, args)
+            self._data = self._data[offset:]
+
+
+def burst(protocol, number):
+    frames = []
+    for i in range(number):
+        handle = 'H:bench:{}'.format(i)
+        frames.append(protocol.serialize_response(Type.JOB_ASSIGN, handle, 'reverse', 'workload'))
+        frames.append(protocol.serialize_response(Type.WORK_COMPLETE, handle, 'result'))
+    return b''.join(frames)
+
+
+def measure(cls, data, chunk):
+    protocol = cls()
+    start = time.perf_counter()
+    for i in range(0, len(data), chunk):
+        protocol.data_received(data[i:i + chunk])
+    return time.perf_counter() - start
+
+
+def report(title, data, chunk):
+    legacy = measure(LegacyProtocol, data, chunk)
+    current = measure(GearmanProtocolMixin, data, chunk)
+    print('{:<48} legacy {:8.4f}s  current {:8.4f}s  speedup {:6.1f}x'.format(
+        title, legacy, current, legacy / current))
+
+
+def main(number, size, chunk):
+    protocol = GearmanProtocolMixin()
+    data = burst(protocol, number)
+    report('{} JOB_ASSIGN/WORK_COMPLETE, one read'.format(number), data, len(data))
+    report('{} JOB_ASSIGN/WORK_COMPLETE, {}B reads'.format(number, chunk), data, chunk)
+
+    workload = 'x' * size
+    data = protocol.serialize_response(Type.JOB_ASSIGN, 'H:bench:0', 'reverse', workload)
+    report('{}B workload, {}B reads'.format(size, chunk), data, chunk)
+
+
+if __name__ == '__main__':
+    # Nobody waits for the frames, keep the un-expected message warnings quiet
+    logging.disable(logging.WARNING)
+    args = parse_args()
+    main(args.number, args.size, args.chunk)
@@ -0,0 +1,109 @@
+import sys
+import os.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+import asyncio
+import argparse
+from collections import deque
+from aiogear import Worker, PacketType
+from tests.utils import GearmanServerMock
+
+
+def parse_args():
+    args = sys.argv[1:]
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--number', type=int, default=5000, help='Number of queued jobs.')
+    parser.add_argument('-l', '--latency', type=float, default=0.0005,
+                        help='One way latency of the mock server in seconds.')
+    return parser.parse_args(args)
+
+
+class DelayedTransport:
+    """
+    Delivers everything written after `latency` seconds, in order.
+    """
+    def __init__(self, loop, transport, latency):
+        self.loop = loop
+        self.transport = transport
+        self.latency = latency
+        self.queue = deque()
+
+    def write(self, data):
+        if not self.latency:
+            self.transport.write(data)
+            return
+        self.queue.append(data)
+        self.loop.call_later(self.latency, self.release)
+
+    def release(self):
+        self.transport.write(self.queue.popleft())
+
+
+class QueueServerMock(GearmanServerMock):
+    def __init__(self, loop, jobs, latency, done):
+        # The mock only calls plain functions, not bound methods
+        super(QueueServerMock, self).__init__(loop, messaging={
+            PacketType.PRE_SLEEP: lambda packet: self.pre_sleep(packet),
+            PacketType.GRAB_JOB: lambda packet: self.grab_job(packet),
+            PacketType.WORK_COMPLETE: lambda packet: self.work_complete(packet),
+        })
+        self.jobs = jobs
+        self.latency = latency
+        self.done = done
+        self.assigned = 0
+        self.completed = 0
+
+    def connection_made(self, transport):
+        super(QueueServerMock, self).connection_made(
+            DelayedTransport(self.loop, transport, self.latency))
+
+    def pre_sleep(self, _):
+        if self.assigned < self.jobs:
+            return PacketType.NOOP,
+
+    def grab_job(self, _):
+        if self.assigned >= self.jobs:
+            return PacketType.NO_JOB,
+        self.assigned += 1
+        return PacketType.JOB_ASSIGN, 'H:bench:{}'.format(self.assigned), 'echo', 'workload'
+
+    def work_complete(self, _):
+        self.completed += 1
+        if self.completed == self.jobs:
+            self.done.set_result(time.perf_counter())
+
+
+def echo(job_info):
+    return job_info.workload
+
+
+async def measure(loop, jobs, latency, eager):
+    done = loop.create_future()
+    server = await loop.create_server(
+        lambda: QueueServerMock(loop, jobs, latency, done), '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    start = time.perf_counter()
+    _, worker = await loop.create_connection(
+        lambda: Worker(echo, loop=loop, eager=eager), '127.0.0.1', port)
+    end = await done
+    await worker.shutdown()
+    server.close()
+    await server.wait_closed()
+    return jobs / (end - start)
+
+
+def main(jobs, latency):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    before = loop.run_until_complete(measure(loop, jobs, latency, eager=False))
+    after = loop.run_until_complete(measure(loop, jobs, latency, eager=True))
+    loop.close()
+    print('{} jobs, {:.2f}ms latency'.format(jobs, latency * 1000))
+    print('PRE_SLEEP before every grab {:10.1f} jobs/s'.format(before))
+    print('eager grab                  {:10.1f} jobs/s ({:.2f}x)'.format(after, after / before))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args.number, args.latency)
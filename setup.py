@@ -8,6 +8,11 @@ setup(
     url='https://github.com/sardok/aiogear',
     description='Asynchronous gearman protocol based on asyncio',
     packages=['aiogear'],
+    entry_points={
+        'console_scripts': [
+            'aiogear-worker = aiogear.supervisor:main',
+        ],
+    },
     classifiers=[
         'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
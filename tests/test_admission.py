@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+
+from aiogear import Client, Admin, AdmissionController
+from aiogear.admission import _Limit
+from aiogear.exception import Overloaded
+from .utils import run_job_server, connect_client
+
+
+class AdminServerMock(asyncio.Protocol):
+    """
+    Answers `status` with the queues in `queues`, function -> (total, running).
+    """
+    def __init__(self, queues):
+        self.queues = queues
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        for _ in data.split(b'\n')[:-1]:
+            lines = ['{}\t{}\t{}\t1\n'.format(name, total, running) for name, (total, running) in self.queues.items()]
+            self.transport.write(''.join(lines).encode('ascii') + b'.\n')
+
+
+async def connect(loop, job_port, admin_port, queues):
+    await run_job_server(loop, job_port, batch=3)
+    await loop.create_server(lambda: AdminServerMock(queues), '127.0.0.1', admin_port)
+    client = await connect_client(loop, job_port, lambda: Client(loop=loop))
+    _, admin = await loop.create_connection(lambda: Admin(loop=loop), '127.0.0.1', admin_port)
+    return client, admin
+
+
+@pytest.mark.asyncio
+async def test_in_flight_cap(event_loop, unused_tcp_port_factory):
+    client, admin = await connect(event_loop, unused_tcp_port_factory(), unused_tcp_port_factory(), {})
+    controller = AdmissionController(client, admin, max_in_flight=3, loop=event_loop)
+    peak = 0
+
+    async def run(workload):
+        nonlocal peak
+        job_created = await controller.submit_job('reverse', workload)
+        peak = max(peak, controller.in_flight)
+        return await controller.wait_job(job_created.handle)
+
+    # The mock completes jobs three at a time
+    responses = await asyncio.wait_for(asyncio.gather(*[run(str(i)) for i in range(9)]), timeout=1)
+    assert sorted(response.result for response in responses) == [str(i) for i in range(9)]
+    assert peak == 3
+    assert controller.in_flight == 0
+    assert controller.stats['admitted'] == 9
+    await client.close()
+    admin.close()
+
+
+@pytest.mark.asyncio
+async def test_aimd_rates(event_loop):
+    controller = AdmissionController(
+        Client(loop=event_loop), None, threshold=1000, increase=10, min_rate=30, loop=event_loop)
+    overloaded = [{'function': 'reverse', 'total': 5000, 'running': 10}]
+
+    # Cut from the rate it was submitted at, 200 jobs in the last second
+    controller._polled_at = event_loop.time() - 1
+    controller.limits['reverse'] = limit = _Limit()
+    limit.submitted = 200
+    controller.update(overloaded)
+    assert limit.overloaded and limit.backlog == 4990
+    assert 99 < limit.rate <= 100
+
+    controller.update(overloaded)
+    assert 49 < limit.rate <= 50
+    controller.update(overloaded)
+    assert limit.rate == 30
+
+    controller.update([{'function': 'reverse', 'total': 10, 'running': 10}])
+    assert not limit.overloaded
+    assert limit.rate == 40
+    # Gone from the status once its queue is empty
+    controller.update([])
+    assert limit.backlog == 0
+    assert limit.rate == 50
+
+    # Paced at the throttled rate
+    limit.rate = 100
+    started = event_loop.time()
+    for _ in range(5):
+        await controller._admit('reverse')
+    # A sleep overshooting a slot lets the next submission through at once
+    assert event_loop.time() - started >= 0.04
+    assert controller.stats['throttled'] >= 1
+
+
+@pytest.mark.asyncio
+async def test_throttling(event_loop, unused_tcp_port_factory):
+    queues = {'reverse': (5000, 10)}
+    client, admin = await connect(event_loop, unused_tcp_port_factory(), unused_tcp_port_factory(), queues)
+    controller = AdmissionController(client, admin, interval=0.01, min_rate=50, loop=event_loop)
+
+    async with controller:
+        for _ in range(10):
+            await controller.submit_job_bg('reverse', 'test')
+        await asyncio.sleep(0.03)
+        for _ in range(5):
+            await controller.submit_job_bg('reverse', 'test')
+        assert controller.limits['reverse'].overloaded
+        assert controller.stats['throttled'] > 0
+        assert controller.stats['admitted'] == 15
+    await client.close()
+    admin.close()
+
+
+@pytest.mark.asyncio
+async def test_load_shedding(event_loop, unused_tcp_port_factory):
+    queues = {'reverse': (5000, 10)}
+    client, admin = await connect(event_loop, unused_tcp_port_factory(), unused_tcp_port_factory(), queues)
+    controller = AdmissionController(client, admin, interval=0.01, shed=True, loop=event_loop)
+
+    async with controller:
+        await controller.submit_job_bg('reverse', 'test')
+        await asyncio.sleep(0.03)
+        with pytest.raises(Overloaded):
+            await controller.submit_job_bg('reverse', 'test')
+        # Other functions are admitted
+        await controller.submit_job_bg('other', 'test')
+        queues['reverse'] = (10, 10)
+        await asyncio.sleep(0.03)
+        await controller.submit_job_bg('reverse', 'test')
+    assert controller.stats['shed'] == 1
+    await client.close()
+    admin.close()
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from aiogear import Client
+from aiogear.cache import ResultCache, SqliteCache
+from aiogear.response import WorkComplete
+from .utils import JobServerMock, connect_client
+
+
+class Clock:
+    now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction():
+    cache = ResultCache(max_entries=2)
+    cache.set('a', 'A')
+    cache.set('b', 'B')
+    assert cache.get('a') == 'A'
+    cache.set('c', 'C')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'A'
+    assert cache.get('c') == 'C'
+    assert cache.stats == {'hits': 3, 'misses': 1, 'evictions': 1}
+
+
+def test_ttl():
+    clock = Clock()
+    cache = ResultCache(ttl=10, clock=clock)
+    cache.set('a', 'A')
+    clock.now = 9
+    assert cache.get('a') == 'A'
+    clock.now = 10
+    assert cache.get('a') is None
+    assert cache.stats['expired'] == 1
+    assert len(cache) == 0
+
+
+def test_max_bytes():
+    cache = ResultCache(max_bytes=10)
+    cache.set('a', b'x' * 6)
+    cache.set('b', b'x' * 6)
+    assert 'a' not in cache.entries
+    assert cache.size == 6
+    cache.set('c', b'x' * 11)
+    assert 'c' not in cache.entries
+    assert cache.get('b') == b'x' * 6
+
+
+@pytest.mark.asyncio
+async def test_client_cache(event_loop, unused_tcp_port):
+    servers = []
+
+    def factory():
+        servers.append(JobServerMock(event_loop))
+        return servers[-1]
+
+    await event_loop.create_server(factory, '127.0.0.1', unused_tcp_port)
+    cache = ResultCache(ttl=60)
+    client = await connect_client(
+        event_loop, unused_tcp_port, lambda: Client(loop=event_loop, cache={'reverse': cache}))
+
+    async def run(function, workload):
+        job_created = await client.submit_job(function, workload)
+        return await client.wait_job(job_created.handle)
+
+    first = await asyncio.wait_for(run('reverse', 'test'), timeout=1)
+    assert first == WorkComplete('H:mock:0', 'tset')
+    for _ in range(5):
+        response = await asyncio.wait_for(run('reverse', 'test'), timeout=1)
+        assert response.result == 'tset'
+        assert response.handle.startswith('C:')
+    await asyncio.wait_for(run('reverse', 'other'), timeout=1)
+    await asyncio.wait_for(run('uncached', 'test'), timeout=1)
+    await asyncio.wait_for(run('uncached', 'test'), timeout=1)
+
+    assert len(servers[0].submitted) == 4
+    assert cache.stats == {'hits': 5, 'misses': 2}
+    assert not client._hits
+    await client.close()
+
+
+def test_sqlite_cache(tmpdir):
+    path = str(tmpdir.join('results.db'))
+    clock = Clock()
+    cache = SqliteCache(path, ttl=10, max_entries=2, trim_every=1, clock=clock)
+    cache.set(('reverse', 'a'), 'A')
+    cache.set(('reverse', 'b'), b'B')
+    clock.now = 1
+    assert cache.get(('reverse', 'a')) == 'A'
+    cache.set(('reverse', 'c'), 'C')
+    assert cache.get(('reverse', 'b')) is None
+    assert cache.stats['evictions'] == 1
+
+    # Shared with another process opening the same file
+    other = SqliteCache(path, clock=clock)
+    assert other.get(('reverse', 'c')) == 'C'
+    clock.now = 20
+    assert cache.get(('reverse', 'a')) is None
+    assert cache.stats['expired'] == 1
+    cache.close()
+    other.close()
+
+
+@pytest.mark.asyncio
+async def test_cache_jobs_completed_with_job_created(event_loop, unused_tcp_port):
+    # WORK_COMPLETE follows JOB_CREATED in the same write
+    await event_loop.create_server(lambda: JobServerMock(event_loop), '127.0.0.1', unused_tcp_port)
+    cache = ResultCache()
+    client = await connect_client(
+        event_loop, unused_tcp_port, lambda: Client(loop=event_loop, cache={'reverse': cache}))
+
+    for _ in range(3):
+        job_created = await client.submit_job('reverse', 'abc', timeout=5)
+        response = await asyncio.wait_for(client.wait_job(job_created.handle), timeout=1)
+        assert response.result == 'cba'
+        await asyncio.sleep(0)
+    assert cache.stats == {'hits': 2, 'misses': 1}
+    assert cache.get(('reverse', client._digest(('abc',)))) == 'cba'
+    await client.close()
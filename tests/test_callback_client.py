@@ -0,0 +1,114 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+from aiogear import CallbackClient, PacketType
+from .utils import JobServerMock, connect_client
+
+
+class GroupServerMock(JobServerMock):
+    """
+    Answers nothing until the whole group is submitted, then creates and
+    completes every job, sending WORK_DATA right before each completion.
+    """
+    group_size = 0
+
+    def on_submit(self, packet, payload):
+        function, uuid, workload = payload.split(b'\0', 2)
+        self.submitted.append((packet, function, uuid, workload))
+        if len(self.submitted) < self.group_size:
+            return
+        responses = []
+        for i, (_, _, uuid, workload) in enumerate(self.submitted):
+            responses.append(self.serialize_response(PacketType.JOB_CREATED, 'H:mock:{}'.format(i)))
+        for i, (_, _, uuid, workload) in enumerate(self.submitted):
+            handle = 'H:mock:{}'.format(i)
+            responses.append(self.serialize_response(PacketType.WORK_DATA, handle, workload.decode('ascii')))
+            responses.append(self.serialize_response(
+                PacketType.WORK_COMPLETE, handle, workload[::-1].decode('ascii')))
+        self.transport.write(b''.join(responses))
+
+
+@pytest.mark.asyncio
+async def test_pipelined_group(event_loop, unused_tcp_port):
+    jobs = 1000
+    GroupServerMock.group_size = jobs
+    await event_loop.create_server(lambda: GroupServerMock(event_loop), '127.0.0.1', unused_tcp_port)
+    client = await connect_client(event_loop, unused_tcp_port, lambda: CallbackClient(loop=event_loop))
+    events = []
+
+    async def on_update(event_type, uuid, data):
+        events.append((event_type, uuid, data))
+
+    client.set_update_callback(on_update)
+    accepted, completed = await client.submit_jobs(
+        'reverse', [('uuid-{}'.format(i), 'job-{}'.format(i)) for i in range(jobs)])
+    await asyncio.wait_for(accepted, timeout=1)
+    results = list(await asyncio.wait_for(completed, timeout=1))
+    await asyncio.sleep(0)
+
+    assert len(results) == jobs
+    assert results[0] == {'state': 'COMPLETE', 'data': '0-boj'}
+    data = {uuid: payload for event_type, uuid, payload in events if event_type == 'data'}
+    assert data == {'uuid-{}'.format(i): 'job-{}'.format(i) for i in range(jobs)}
+    assert Counter(event_type for event_type, _, _ in events)['complete'] == jobs
+    assert not client.awaiting_handles
+    assert not client.pending_handles
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_streamed_results(event_loop, unused_tcp_port):
+    jobs = 200
+    GroupServerMock.group_size = jobs
+    await event_loop.create_server(lambda: GroupServerMock(event_loop), '127.0.0.1', unused_tcp_port)
+    client = await connect_client(
+        event_loop, unused_tcp_port,
+        lambda: CallbackClient(loop=event_loop, stream=True, max_buffered=10, progress_interval=60))
+    batches = []
+
+    async def on_updates(events):
+        batches.append(events)
+
+    client.set_update_callback(on_updates, batched=True)
+    _, completed = await client.submit_jobs(
+        'reverse', [('uuid-{}'.format(i), 'job-{}'.format(i)) for i in range(jobs)])
+
+    results = []
+    async for result in client.results():
+        assert client._results.qsize() <= 10
+        results.append(result)
+        await asyncio.sleep(0)
+    await asyncio.wait_for(completed, timeout=1)
+    await asyncio.sleep(0)
+
+    assert len(results) == jobs
+    assert {result['uuid'] for result in results} == {'uuid-{}'.format(i) for i in range(jobs)}
+    assert results[0] == {'uuid': 'uuid-0', 'state': 'COMPLETE', 'data': '0-boj'}
+    assert not client.completed_results
+    assert not client.handles_to_job
+
+    events = [event for batch in batches for event in batch]
+    assert len(batches) < len(events)
+    progress = [data for event_type, _, data in events if event_type == 'progress']
+    # The initial, first and last completion
+    assert [p['complete'] for p in progress] == [0, 1, jobs]
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_without_update_callback(event_loop, unused_tcp_port, caplog):
+    jobs = 10
+    GroupServerMock.group_size = jobs
+    await event_loop.create_server(lambda: GroupServerMock(event_loop), '127.0.0.1', unused_tcp_port)
+    client = await connect_client(event_loop, unused_tcp_port, lambda: CallbackClient(loop=event_loop))
+    _, completed = await client.submit_jobs(
+        'reverse', [('uuid-{}'.format(i), 'job-{}'.format(i)) for i in range(jobs)])
+    results = list(await asyncio.wait_for(completed, timeout=1))
+    await asyncio.sleep(0)
+
+    assert len(results) == jobs
+    assert not [record for record in caplog.records if record.levelname == 'ERROR']
+    assert not client.pending_handles
+    await client.close()
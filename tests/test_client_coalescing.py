@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from aiogear import Client
+from aiogear.response import WorkComplete
+from .utils import JobServerMock, connect_client
+
+
+async def start(loop, port, batch=10 ** 6, **kwargs):
+    servers = []
+
+    def factory():
+        servers.append(JobServerMock(loop, batch=batch))
+        return servers[-1]
+
+    await loop.create_server(factory, '127.0.0.1', port)
+    client = await connect_client(loop, port, lambda: Client(loop=loop, **kwargs))
+    return servers, client
+
+
+@pytest.mark.asyncio
+async def test_duplicates_share_submission(event_loop, unused_tcp_port):
+    servers, client = await start(event_loop, unused_tcp_port, coalesce=True)
+
+    async def run():
+        job_created = await client.submit_job('reverse', 'test', uuid='same')
+        return await client.wait_job(job_created.handle)
+
+    running = [asyncio.ensure_future(run()) for _ in range(50)]
+    await asyncio.sleep(0.05)
+    assert len(servers[0].submitted) == 1
+    assert client.stats == {'submitted': 1, 'coalesced': 49}
+
+    servers[0].flush(force=True)
+    results = await asyncio.wait_for(asyncio.gather(*running), timeout=1)
+    assert results == [WorkComplete('H:mock:0', 'tset')] * 50
+    assert not client.inflight
+
+    # Finished jobs are submitted again
+    job_created = await client.submit_job('reverse', 'test', uuid='same')
+    assert job_created.handle == 'H:mock:1'
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_completed_with_job_created(event_loop, unused_tcp_port):
+    # WORK_COMPLETE follows JOB_CREATED in the same write
+    servers, client = await start(event_loop, unused_tcp_port, batch=1, coalesce=True)
+
+    async def run(uuid):
+        job_created = await client.submit_job('reverse', 'test', uuid=uuid)
+        return await client.wait_job(job_created.handle)
+
+    for i in range(20):
+        response = await asyncio.wait_for(run('uuid-{}'.format(i)), timeout=1)
+        assert response.result == 'tset'
+    # Duplicates submitted together share the completed job
+    results = await asyncio.wait_for(asyncio.gather(*[run('same') for _ in range(5)]), timeout=1)
+    assert results == [WorkComplete('H:mock:20', 'tset')] * 5
+    assert client.stats == {'submitted': 21, 'coalesced': 4}
+    assert not client.inflight
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_distinct_jobs_are_not_coalesced(event_loop, unused_tcp_port):
+    servers, client = await start(event_loop, unused_tcp_port, coalesce=True)
+    await client.submit_job('reverse', 'test', uuid='same')
+    await client.submit_job_bg('reverse', 'test', uuid='same')
+    await client.submit_job('other', 'test', uuid='same')
+    await client.submit_job('reverse', 'test')
+    await client.submit_job('reverse', 'test')
+    # Background jobs only share the submission until JOB_CREATED
+    await client.submit_job_bg('reverse', 'test', uuid='same')
+
+    assert len(servers[0].submitted) == 6
+    assert client.stats['coalesced'] == 0
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_coalescing_is_opt_in(event_loop, unused_tcp_port):
+    servers, client = await start(event_loop, unused_tcp_port)
+    await asyncio.gather(*[client.submit_job('reverse', 'test', uuid='same') for _ in range(3)])
+    assert len(servers[0].submitted) == 3
+    await client.close()
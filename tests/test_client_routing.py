@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from aiogear import Client, PacketType
+from aiogear.response import WorkComplete
+from .utils import run_job_server, connect_client
+
+
+@pytest.mark.asyncio
+async def test_out_of_order_completion(event_loop, unused_tcp_port):
+    jobs = 5000
+    await run_job_server(event_loop, unused_tcp_port, batch=jobs, shuffle=True)
+    client = await connect_client(event_loop, unused_tcp_port, lambda: Client(loop=event_loop))
+
+    async def run(workload):
+        job_created = await client.submit_job('reverse', workload)
+        result = await client.wait_job(job_created.handle)
+        return workload, job_created, result
+
+    workloads = ['job-{}'.format(i) for i in range(jobs)]
+    done = await asyncio.wait_for(asyncio.gather(*[run(w) for w in workloads]), timeout=10)
+
+    for workload, job_created, result in done:
+        assert result == WorkComplete(job_created.handle, workload[::-1])
+    assert not client.handles
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_background_jobs_are_not_tracked(event_loop, unused_tcp_port):
+    await run_job_server(event_loop, unused_tcp_port)
+    client = await connect_client(event_loop, unused_tcp_port, lambda: Client(loop=event_loop))
+
+    bg = await client.submit_job_bg('reverse', 'background')
+    fg = await client.submit_job('reverse', 'foreground')
+    result = await asyncio.wait_for(client.wait_job(fg.handle), timeout=1)
+
+    assert result == WorkComplete(fg.handle, 'dnuorgerof')
+    assert bg.handle not in client.handles
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_wait_for_completion_packet(event_loop, unused_tcp_port):
+    await run_job_server(event_loop, unused_tcp_port)
+    client = await connect_client(event_loop, unused_tcp_port, lambda: Client(loop=event_loop))
+
+    completed = client.wait_for(PacketType.WORK_COMPLETE)
+    job_created = await client.submit_job('reverse', 'test')
+    result = await asyncio.wait_for(client.wait_job(job_created.handle), timeout=1)
+
+    assert await asyncio.wait_for(completed, timeout=1) == result == WorkComplete(job_created.handle, 'tset')
+    await client.close()
@@ -0,0 +1,109 @@
+import struct
+import asyncio
+
+import pytest
+
+from aiogear import PacketType, Worker, Client
+from aiogear.codec import Codec, MAGIC
+from aiogear.response import WorkComplete, WorkException
+from .utils import JobServerMock, run_mock_server, connect_worker, connect_client
+
+WORKLOAD = {'name': 'aiogear', 'items': list(range(500))}
+
+
+@pytest.mark.parametrize('serializer', ['json', 'pickle', 'raw'])
+@pytest.mark.parametrize('compression', [None, 'zlib', 'lzma'])
+def test_round_trip(serializer, compression):
+    codec = Codec(serializer, compression=compression, threshold=64)
+    obj = b'payload' * 100 if serializer == 'raw' else WORKLOAD
+    encoded = codec.encode(obj)
+    assert encoded.startswith(MAGIC)
+    assert codec.decode(memoryview(encoded)) == obj
+
+
+def test_compression_threshold():
+    codec = Codec('json', compression='zlib', threshold=1024)
+    small = codec.encode([1, 2, 3])
+    large = codec.encode(WORKLOAD)
+    assert small[len(MAGIC) + 1:len(MAGIC) + 2] == b'-'
+    assert large[len(MAGIC) + 1:len(MAGIC) + 2] == b'z'
+    assert len(large) < len(Codec('json').encode(WORKLOAD))
+
+
+def test_header_negotiation():
+    # Decoding follows the header, not the settings of the decoding codec
+    encoded = Codec('raw', compression='lzma', threshold=0).encode(b'x' * 100)
+    assert Codec('json').decode(encoded) == b'x' * 100
+
+
+def test_headerless_payload():
+    assert Codec('json').decode(b'{"a": 1}') == {'a': 1}
+
+
+def test_untrusted_pickle():
+    encoded = Codec('pickle').encode(WORKLOAD)
+    with pytest.raises(RuntimeError):
+        Codec('json').decode(encoded)
+    assert Codec('json', trusted=True).decode(encoded) == WORKLOAD
+
+
+def test_unknown_serializer():
+    with pytest.raises(RuntimeError):
+        Codec('yaml')
+
+
+class EchoServerMock(JobServerMock):
+    def on_submit(self, packet, payload):
+        _, _, workload = payload.split(b'\0', 2)
+        self.transport.write(self.serialize_response(PacketType.JOB_CREATED, 'test_handle'))
+        body = b'test_handle\0' + workload
+        self.transport.write(struct.pack('>4sII', b'\0RES', PacketType.WORK_COMPLETE.value, len(body)) + body)
+
+
+@pytest.mark.asyncio
+async def test_client_codec(event_loop, unused_tcp_port):
+    await event_loop.create_server(lambda: EchoServerMock(event_loop), '127.0.0.1', unused_tcp_port)
+    codec = Codec('json', compression='zlib', threshold=64)
+    client = await connect_client(event_loop, unused_tcp_port, lambda: Client(loop=event_loop, codec=codec))
+    job_created = await client.submit_job('echo', WORKLOAD)
+    response = await client.wait_job(job_created.handle)
+    assert response == WorkComplete('test_handle', WORKLOAD)
+    await client.close()
+
+
+class BrokenEchoServerMock(EchoServerMock):
+    def on_submit(self, packet, payload):
+        function, uuid, _ = payload.split(b'\0', 2)
+        super(BrokenEchoServerMock, self).on_submit(packet, b'\0'.join([function, uuid, MAGIC + b'j-{']))
+
+
+@pytest.mark.asyncio
+async def test_client_undecodable_result(event_loop, unused_tcp_port):
+    await event_loop.create_server(lambda: BrokenEchoServerMock(event_loop), '127.0.0.1', unused_tcp_port)
+    client = await connect_client(event_loop, unused_tcp_port, lambda: Client(loop=event_loop, codec=Codec('json')))
+    job_created = await client.submit_job('echo', WORKLOAD)
+    response = await client.wait_job(job_created.handle)
+    assert isinstance(response, WorkException)
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_worker_codec(event_loop, unused_tcp_port):
+    workloads = []
+    completed = event_loop.create_future()
+
+    def echo(job_info):
+        workloads.append(job_info.workload)
+        return job_info.workload
+
+    mock_protocol = {
+        PacketType.PRE_SLEEP: (PacketType.NOOP,),
+        PacketType.GRAB_JOB: (PacketType.JOB_ASSIGN, 'test_handle', 'echo', '{"a": [1, 2]}'),
+        PacketType.WORK_COMPLETE: lambda _: completed.done() or completed.set_result(True),
+    }
+    await run_mock_server(event_loop, unused_tcp_port, messaging=mock_protocol)
+    worker = await connect_worker(
+        event_loop, unused_tcp_port, lambda: Worker((echo, 'echo'), loop=event_loop, codec=Codec('json')))
+    await asyncio.wait_for(completed, timeout=1)
+    assert workloads[0] == {'a': [1, 2]}
+    await worker.shutdown()
@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+from aiogear import PacketType, Worker, Client
+from aiogear.cache import ResultCache
+from aiogear.exception import JobTimeout
+from .utils import run_mock_server, run_job_server, connect_worker, connect_client
+
+
+@pytest.mark.asyncio
+async def test_worker_deadline(event_loop, unused_tcp_port):
+    failed = asyncio.Queue()
+    completed = asyncio.Queue()
+    handles = iter(range(100))
+
+    async def slow(_):
+        await asyncio.sleep(10)
+
+    async def fast(job_info):
+        return job_info.workload
+
+    def assign(_):
+        handle = next(handles)
+        function = 'slow' if handle % 2 else 'fast'
+        return PacketType.JOB_ASSIGN, 'H:{}'.format(handle), function, 'test'
+
+    mock_protocol = {
+        PacketType.PRE_SLEEP: (PacketType.NOOP,),
+        PacketType.GRAB_JOB: assign,
+        PacketType.WORK_FAIL: lambda packet: failed.put_nowait(packet),
+        PacketType.WORK_COMPLETE: lambda packet: completed.put_nowait(packet),
+    }
+    await run_mock_server(event_loop, unused_tcp_port, messaging=mock_protocol)
+    worker = await connect_worker(event_loop, unused_tcp_port, lambda: Worker(
+        slow, fast, loop=event_loop, max_in_flight=4, timeouts={'slow': 0.05}))
+    for _ in range(2):
+        await asyncio.wait_for(failed.get(), timeout=1)
+    await asyncio.wait_for(completed.get(), timeout=1)
+    await worker.shutdown()
+
+    assert worker.stats['timeouts'] >= 2
+    assert worker.job_timeout('fast') is None
+
+
+@pytest.mark.asyncio
+async def test_client_deadline(event_loop, unused_tcp_port):
+    # Completions are held back until a second job is pending
+    await run_job_server(event_loop, unused_tcp_port, batch=2)
+    client = await connect_client(event_loop, unused_tcp_port, lambda: Client(loop=event_loop))
+
+    job_created = await client.submit_job('reverse', 'test', timeout=0.05)
+    with pytest.raises(JobTimeout) as ex:
+        await asyncio.wait_for(client.wait_job(job_created.handle), timeout=1)
+    assert ex.value.handle == job_created.handle
+    assert not client.handles
+    assert client.stats['timeouts'] == 1
+    with pytest.raises(JobTimeout):
+        await client.wait_job(job_created.handle)
+
+    # Releases the late completion of the expired job, which is dropped
+    await client.submit_job('reverse', 'other', timeout=1)
+    await asyncio.sleep(0.01)
+    assert not client.handles
+    assert client.stats['timeouts'] == 1
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_completed_with_job_created(event_loop, unused_tcp_port):
+    # WORK_COMPLETE follows JOB_CREATED in the same write
+    await run_job_server(event_loop, unused_tcp_port)
+    client = await connect_client(event_loop, unused_tcp_port, lambda: Client(loop=event_loop))
+
+    for i in range(20):
+        job_created = await client.submit_job('reverse', 'job-{}'.format(i), timeout=5)
+        response = await asyncio.wait_for(client.wait_job(job_created.handle), timeout=1)
+        assert response.result == 'job-{}'.format(i)[::-1]
+    await asyncio.sleep(0.01)
+    assert not client.stats['timeouts']
+    assert not client.handles
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_expired_job_is_not_cached(event_loop, unused_tcp_port, caplog):
+    await run_job_server(event_loop, unused_tcp_port, batch=2)
+    cache = ResultCache()
+    client = await connect_client(
+        event_loop, unused_tcp_port, lambda: Client(loop=event_loop, cache={'reverse': cache}))
+
+    job_created = await client.submit_job('reverse', 'test', timeout=0.05)
+    with pytest.raises(JobTimeout):
+        await asyncio.wait_for(client.wait_job(job_created.handle), timeout=1)
+    await asyncio.sleep(0)
+    assert not len(cache)
+    assert not [record for record in caplog.records if record.levelname == 'ERROR']
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_submit_many_deadline(event_loop, unused_tcp_port):
+    # Completes jobs three at a time, the fourth is left pending
+    await run_job_server(event_loop, unused_tcp_port, batch=3)
+    client = await connect_client(event_loop, unused_tcp_port, lambda: Client(loop=event_loop))
+
+    async def collect():
+        jobs = client.submit_many('reverse', ['a', 'b', 'c', 'd'], window=3, timeout=0.05)
+        return [done async for done in jobs]
+
+    done = await asyncio.wait_for(collect(), timeout=1)
+    responses = [response for _, _, response in done]
+    assert sorted(response.result for response in responses[:3]) == ['a', 'b', 'c']
+    assert isinstance(responses[3], JobTimeout)
+    assert responses[3].handle == done[3][1]
+    assert not client.handles
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_job_not_created_in_time(event_loop, unused_tcp_port):
+    await run_mock_server(event_loop, unused_tcp_port)
+    client = await connect_client(event_loop, unused_tcp_port, lambda: Client(loop=event_loop))
+    with pytest.raises(JobTimeout):
+        await client.submit_job('reverse', 'test', timeout=0.05)
+    assert not client.handles
+    await client.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('timeouts', [{}, {'late': 1}])
+async def test_timeout_error_raised_by_job(event_loop, unused_tcp_port, timeouts):
+    received = asyncio.Queue()
+
+    async def late(_):
+        raise asyncio.TimeoutError('upstream is late')
+
+    mock_protocol = {
+        PacketType.PRE_SLEEP: (PacketType.NOOP,),
+        PacketType.GRAB_JOB: (PacketType.JOB_ASSIGN, 'H:0', 'late', 'test'),
+        PacketType.WORK_FAIL: lambda packet: received.put_nowait(packet),
+        PacketType.WORK_EXCEPTION: lambda packet: received.put_nowait(packet),
+    }
+    await run_mock_server(event_loop, unused_tcp_port, messaging=mock_protocol)
+    worker = await connect_worker(event_loop, unused_tcp_port, lambda: Worker(
+        late, loop=event_loop, timeouts=timeouts))
+    assert await asyncio.wait_for(received.get(), timeout=1) == PacketType.WORK_EXCEPTION
+    await worker.shutdown()
+
+    assert not worker.stats['timeouts']
+    assert worker.stats['exception'] >= 1
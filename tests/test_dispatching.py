@@ -0,0 +1,58 @@
+from aiogear.mixin import GearmanProtocolMixin
+from aiogear.packet import Type
+
+
+def _protocol():
+    return GearmanProtocolMixin()
+
+
+def _dispatch(protocol, packet):
+    cb = protocol.get_registered(packet)
+    if cb:
+        cb(packet, None)
+
+
+def test_fifo_per_packet_type():
+    protocol = _protocol()
+    called = []
+    for i in range(3):
+        protocol.do_register(lambda *_, i=i: called.append(i), Type.JOB_CREATED)
+    for _ in range(3):
+        _dispatch(protocol, Type.JOB_CREATED)
+    assert called == [0, 1, 2]
+    assert protocol.get_registered(Type.JOB_CREATED) is None
+
+
+def test_multi_packet_registration_consumed_once():
+    protocol = _protocol()
+    called = []
+    protocol.do_register(lambda *_: called.append('grab'), Type.NO_JOB, Type.JOB_ASSIGN)
+    protocol.do_register(lambda *_: called.append('assign'), Type.JOB_ASSIGN)
+    _dispatch(protocol, Type.NO_JOB)
+    _dispatch(protocol, Type.JOB_ASSIGN)
+    assert called == ['grab', 'assign']
+    assert protocol.get_registered(Type.NO_JOB) is None
+    assert protocol.get_registered(Type.JOB_ASSIGN) is None
+
+
+def test_registration_order_preserved_across_types():
+    protocol = _protocol()
+    called = []
+    protocol.do_register(lambda *_: called.append(1), Type.WORK_COMPLETE, Type.WORK_FAIL)
+    protocol.do_register(lambda *_: called.append(2), Type.WORK_FAIL)
+    protocol.do_register(lambda *_: called.append(3), Type.WORK_COMPLETE, Type.WORK_FAIL)
+    _dispatch(protocol, Type.WORK_FAIL)
+    _dispatch(protocol, Type.WORK_COMPLETE)
+    _dispatch(protocol, Type.WORK_FAIL)
+    assert called == [1, 3, 2]
+
+
+def test_stale_entries_are_purged():
+    protocol = _protocol()
+    for _ in range(10000):
+        protocol.do_register(lambda *_: None, Type.WORK_COMPLETE, Type.WORK_FAIL, Type.WORK_EXCEPTION)
+    for _ in range(10000):
+        _dispatch(protocol, Type.WORK_COMPLETE)
+    assert len(protocol._registers[Type.WORK_FAIL]) <= GearmanProtocolMixin._stale_threshold
+    assert len(protocol._registers[Type.WORK_EXCEPTION]) <= GearmanProtocolMixin._stale_threshold
+    assert protocol.get_registered(Type.WORK_FAIL) is None
@@ -0,0 +1,56 @@
+import asyncio
+from unittest import mock
+
+import pytest
+
+from aiogear import PacketType, Client
+from aiogear.mixin import GearmanProtocolMixin
+from .utils import run_job_server, connect_client
+
+
+@pytest.mark.asyncio
+async def test_submit_waits_while_paused(event_loop, unused_tcp_port):
+    await run_job_server(event_loop, unused_tcp_port)
+    client = await connect_client(event_loop, unused_tcp_port, lambda: Client(loop=event_loop))
+
+    async def submit():
+        job_created = await client.submit_job('reverse', 'test')
+        return await client.wait_job(job_created.handle)
+
+    client.pause_writing()
+    submitted = asyncio.ensure_future(submit())
+    await asyncio.sleep(0.05)
+    assert not submitted.done()
+
+    client.resume_writing()
+    response = await asyncio.wait_for(submitted, timeout=1)
+    assert response.result == 'tset'
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_drain_fails_on_connection_lost(event_loop):
+    protocol = GearmanProtocolMixin(loop=event_loop)
+    protocol.connection_made(mock.Mock())
+    protocol.pause_writing()
+    draining = asyncio.ensure_future(protocol.drain())
+    await asyncio.sleep(0)
+    protocol.connection_lost(None)
+    with pytest.raises(ConnectionResetError):
+        await draining
+
+
+def test_write_buffer_limits():
+    protocol = GearmanProtocolMixin(high_water=1024, low_water=256)
+    transport = mock.Mock()
+    protocol.connection_made(transport)
+    transport.set_write_buffer_limits.assert_called_once_with(high=1024, low=256)
+
+
+def test_oversized_packet_aborts():
+    protocol = GearmanProtocolMixin(max_buffer_size=1024)
+    transport = mock.Mock()
+    protocol.connection_made(transport)
+    protocol.data_received(protocol._header.pack(b'\0RES', PacketType.WORK_COMPLETE.value, 1024 ** 3))
+    transport.abort.assert_called_once_with()
+    assert len(protocol._buffer) == 0
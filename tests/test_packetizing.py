@@ -2,6 +2,7 @@ import pytest
 import asyncio
 from struct import pack
 from functools import partial
+from unittest import mock
 from aiogear.mixin import GearmanProtocolMixin
 from aiogear.packet import Type
 from aiogear.response import NoJob, JobCreated, JobAssign, Noop, WorkComplete
@@ -83,3 +84,60 @@ class TestPacketizing:
 
         await self.when_data_received(data2[5:], event_loop)
         self.then_expect_result(JobAssign('handle2', 'reverse2', ''))
+
+    def test_burst_receive(self):
+        self.given_protocol_params()
+        received = []
+        frames = []
+        for i in range(1000):
+            handle = 'H:lap:{}'.format(i)
+            frames.append(self.protocol.serialize_response(Type.JOB_ASSIGN, handle, 'reverse', 'test'))
+            frames.append(self.protocol.serialize_response(Type.WORK_COMPLETE, handle, 'tset'))
+            self.protocol.do_register(lambda *xs: received.append(xs[1]), Type.JOB_ASSIGN)
+            self.protocol.do_register(lambda *xs: received.append(xs[1]), Type.WORK_COMPLETE)
+        data = b''.join(frames)
+        # Feed the burst in uneven chunks so frames straddle reads
+        for i in range(0, len(data), 7):
+            self.protocol.data_received(data[i:i + 7])
+
+        assert len(received) == 2000
+        assert received[0] == JobAssign('H:lap:0', 'reverse', 'test')
+        assert received[-1] == WorkComplete('H:lap:999', 'tset')
+        assert len(self.protocol._buffer) == 0
+
+    def test_raw_payloads(self):
+        self.protocol = GearmanProtocolMixin(raw=True)
+        received = []
+        workload = bytes(range(256))
+        self.protocol.do_register(lambda *xs: received.append(xs[1]), Type.JOB_ASSIGN)
+        self.protocol.do_register(lambda *xs: received.append(xs[1]), Type.WORK_COMPLETE)
+        self.protocol.data_received(
+            self.protocol.serialize_response(Type.JOB_ASSIGN, 'H:lap:1', 'reverse', workload) +
+            self.protocol.serialize_response(Type.WORK_COMPLETE, 'H:lap:1', workload[::-1]))
+
+        job_assign, work_complete = received
+        assert job_assign.handle == 'H:lap:1'
+        assert job_assign.function == 'reverse'
+        assert isinstance(job_assign.workload, memoryview)
+        assert job_assign.workload == workload
+        assert work_complete.result == workload[::-1]
+
+    def test_non_ascii_request(self):
+        self.given_protocol_params()
+        data = self.protocol.serialize_request(Type.WORK_COMPLETE, 'H:lap:1', 'süß')
+        assert data == _pack_req('II8s5s', 13, 13, b'H:lap:1\0', 'süß'.encode('utf8'))
+
+    @pytest.mark.asyncio
+    async def test_coalesced_writes(self, event_loop):
+        self.protocol = GearmanProtocolMixin(loop=event_loop)
+        writes = []
+        self.protocol.transport = mock.Mock()
+        self.protocol.transport.writelines = lambda chunks: writes.append(b''.join(chunks))
+        self.protocol.send(Type.PRE_SLEEP)
+        self.protocol.send(Type.GRAB_JOB)
+        self.protocol.send(Type.WORK_COMPLETE, 'H:lap:1', 'tset')
+        assert writes == []
+
+        await asyncio.sleep(0)
+        assert writes == [
+            _pack_req('II', 4, 0) + _pack_req('II', 9, 0) + _pack_req('II8s4s', 13, 12, b'H:lap:1\0', b'tset')]
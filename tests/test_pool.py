@@ -0,0 +1,123 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+from aiogear import PacketType
+from aiogear.pool import ClientPool
+from aiogear.response import WorkComplete, StatusRes
+from .utils import JobServerMock
+
+
+async def start_servers(loop, ports):
+    protocols = {port: [] for port in ports}
+    servers = {}
+    for i, port in enumerate(ports):
+        servers[port] = await start_server(loop, port, 'H:{}:'.format(i), protocols[port])
+    return servers, protocols
+
+
+def start_server(loop, port, prefix, protocols, numerator='1'):
+    def factory():
+        protocol = JobServerMock(loop, prefix=prefix, messaging={
+            PacketType.GET_STATUS: (PacketType.STATUS_RES, prefix, '1', '1', numerator, '2'),
+        })
+        protocols.append(protocol)
+        return protocol
+    return loop.create_server(factory, '127.0.0.1', port)
+
+
+async def run_job(pool, workload, **kwargs):
+    job_created = await pool.submit_job('reverse', workload, **kwargs)
+    return job_created, await pool.wait_job(job_created.handle)
+
+
+@pytest.mark.asyncio
+async def test_consistent_routing(event_loop, unused_tcp_port_factory):
+    ports = [unused_tcp_port_factory() for _ in range(3)]
+    await start_servers(event_loop, ports)
+    pool = ClientPool(['127.0.0.1:{}'.format(port) for port in ports], connections=2, loop=event_loop)
+    await pool.connect()
+
+    done = await asyncio.wait_for(asyncio.gather(*[run_job(pool, 'job-{}'.format(i)) for i in range(300)]), 2)
+    for i, (job_created, response) in enumerate(done):
+        assert response == WorkComplete(job_created.handle, 'job-{}'.format(i)[::-1])
+    per_server = Counter(job_created.handle.split(':')[1] for job_created, _ in done)
+    assert sorted(per_server) == ['0', '1', '2']
+
+    handles = set()
+    for _ in range(5):
+        job_created, _ = await run_job(pool, 'unique', uuid='same-uuid')
+        handles.add(job_created.handle.split(':')[1])
+    assert len(handles) == 1
+
+    status = await pool.get_status(done[0][0].handle)
+    assert status == StatusRes(done[0][0].handle, True, True, 1, 2)
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_colliding_handles(event_loop, unused_tcp_port_factory):
+    ports = [unused_tcp_port_factory() for _ in range(2)]
+    # Both servers number their handles alike, telling their status apart
+    for i, port in enumerate(ports):
+        await start_server(event_loop, port, 'H:same:', [], numerator=str(i))
+    pool = ClientPool([('127.0.0.1', port) for port in ports], loop=event_loop)
+    await pool.connect()
+
+    uuids = {}
+    for i in range(100):
+        uuids.setdefault(pool.server_for('uuid-{}'.format(i)), 'uuid-{}'.format(i))
+    assert len(uuids) == 2
+    done = []
+    for port in ports:
+        uuid = uuids[('127.0.0.1', port)]
+        done.append(await run_job(pool, uuid, uuid=uuid))
+
+    (first, first_response), (second, second_response) = done
+    assert first.handle == 'H:same:0@127.0.0.1:{}'.format(ports[0])
+    assert second.handle == 'H:same:0@127.0.0.1:{}'.format(ports[1])
+    assert first_response == WorkComplete(first.handle, uuids[('127.0.0.1', ports[0])][::-1])
+    assert second_response == WorkComplete(second.handle, uuids[('127.0.0.1', ports[1])][::-1])
+    assert (await pool.get_status(first.handle)).numerator == 0
+    assert (await pool.get_status(second.handle)).numerator == 1
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_unhealthy_server_is_skipped(event_loop, unused_tcp_port_factory):
+    ports = [unused_tcp_port_factory() for _ in range(2)]
+    servers, protocols = await start_servers(event_loop, ports)
+    pool = ClientPool([('127.0.0.1', port) for port in ports], loop=event_loop, retry_interval=0.01)
+    await pool.connect()
+
+    uuids = ['uuid-{}'.format(i) for i in range(50)]
+    down = pool.server_for(uuids[0])
+    servers[down[1]].close()
+    for protocol in protocols[down[1]]:
+        protocol.transport.close()
+    await asyncio.sleep(0.05)
+    assert pool.healthy() == [server for server in pool.servers if server != down]
+
+    for uuid in uuids:
+        assert pool.server_for(uuid) != down
+    job_created, response = await asyncio.wait_for(run_job(pool, 'test', uuid=uuids[0]), 1)
+    assert response.result == 'tset'
+
+    await start_server(event_loop, down[1], 'H:back:', protocols[down[1]])
+    for _ in range(100):
+        if len(pool.healthy()) == 2:
+            break
+        await asyncio.sleep(0.01)
+    assert pool.server_for(uuids[0]) == down
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_no_server_available(event_loop, unused_tcp_port):
+    pool = ClientPool([('127.0.0.1', unused_tcp_port)], loop=event_loop, retry_interval=10)
+    with pytest.raises(RuntimeError):
+        await pool.connect()
+    with pytest.raises(RuntimeError):
+        await pool.submit_job('reverse', 'test')
+    await pool.close()
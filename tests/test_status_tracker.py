@@ -0,0 +1,98 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+from aiogear import PacketType, Client, StatusTracker
+from aiogear.response import StatusRes, StatusResUnique
+from .utils import GearmanServerMock, connect_client
+
+
+class StatusServerMock(GearmanServerMock):
+    """
+    H:progress advances by one step per poll and is gone after the fourth
+    one, H:stuck never changes and H:gone is unknown.
+    """
+    def __init__(self, loop):
+        super(StatusServerMock, self).__init__(loop)
+        self.polls = Counter()
+        self.writes = 0
+
+    def data_received(self, data):
+        self.data += data
+        responses = []
+        for packet, payload in self.extract_frames():
+            key = payload.decode('ascii')
+            self.polls[key] += 1
+            if packet is PacketType.GET_STATUS_UNIQUE:
+                responses.append((PacketType.STATUS_RES_UNIQUE, key, '1', '0', '0', '0', '3'))
+            elif key == 'H:progress' and self.polls[key] < 4:
+                responses.append((PacketType.STATUS_RES, key, '1', '1', str(self.polls[key]), '3'))
+            elif key == 'H:stuck':
+                responses.append((PacketType.STATUS_RES, key, '1', '0', '0', '0'))
+            else:
+                responses.append((PacketType.STATUS_RES, key, '0', '0', '0', '0'))
+        self.writes += 1
+        self.transport.write(b''.join(self.serialize_response(*response) for response in responses))
+
+
+async def _collect(tracker):
+    return [status async for status in tracker]
+
+
+@pytest.mark.asyncio
+async def test_status_tracker(event_loop, unused_tcp_port):
+    servers = []
+
+    def factory():
+        servers.append(StatusServerMock(event_loop))
+        return servers[-1]
+
+    await event_loop.create_server(factory, '127.0.0.1', unused_tcp_port)
+    client = await connect_client(event_loop, unused_tcp_port, lambda: Client(loop=event_loop))
+    tracker = StatusTracker(
+        client, handles=['H:progress', 'H:stuck', 'H:gone'], uuids=['report-42'], interval=0.01)
+
+    changes = []
+
+    async def consume():
+        async for status in tracker:
+            changes.append(status)
+            if len(changes) == 7:
+                tracker.stop()
+
+    await asyncio.wait_for(consume(), timeout=1)
+
+    assert changes == [
+        StatusRes('H:progress', True, True, 1, 3),
+        StatusRes('H:stuck', True, False, 0, 0),
+        StatusRes('H:gone', False, False, 0, 0),
+        StatusResUnique('report-42', True, False, 0, 0, 3),
+        StatusRes('H:progress', True, True, 2, 3),
+        StatusRes('H:progress', True, True, 3, 3),
+        StatusRes('H:progress', False, False, 0, 0),
+    ]
+    assert servers[0].polls['H:gone'] == 1
+    assert len(tracker) == 2
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_pipelined_batches(event_loop, unused_tcp_port):
+    servers = []
+
+    def factory():
+        servers.append(StatusServerMock(event_loop))
+        return servers[-1]
+
+    await event_loop.create_server(factory, '127.0.0.1', unused_tcp_port)
+    client = await connect_client(event_loop, unused_tcp_port, lambda: Client(loop=event_loop))
+    handles = ['H:gone:{}'.format(i) for i in range(500)]
+    tracker = StatusTracker(client, handles=handles, batch=250)
+
+    changes = await asyncio.wait_for(_collect(tracker), timeout=1)
+    assert [status.handle for status in changes] == handles
+    assert not tracker
+    # Every batch goes out within one write
+    assert servers[0].writes <= 4
+    await client.close()
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from aiogear import PacketType, Worker, Client, Progress
+from aiogear.response import WorkData, WorkStatus, WorkWarning, WorkComplete
+from .utils import run_mock_server, run_job_server, connect_worker, connect_client
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('generator', ['async', 'sync'])
+async def test_worker_streams_chunks(event_loop, unused_tcp_port, generator):
+    received = []
+    completed = event_loop.create_future()
+
+    async def async_chunks(job_info):
+        yield 'first'
+        await asyncio.sleep(0)
+        yield Progress(1, 2)
+        yield 'second'
+
+    def sync_chunks(job_info):
+        yield 'first'
+        yield Progress(1, 2)
+        yield 'second'
+
+    def _record(packet):
+        received.append(packet)
+        if packet == PacketType.WORK_COMPLETE:
+            completed.set_result(True)
+
+    mock_protocol = {
+        PacketType.PRE_SLEEP: (PacketType.NOOP,),
+        PacketType.GRAB_JOB: (PacketType.JOB_ASSIGN, 'test_handle', 'chunks', 'test_workload'),
+        PacketType.WORK_DATA: _record,
+        PacketType.WORK_STATUS: _record,
+        PacketType.WORK_COMPLETE: _record,
+    }
+    func = async_chunks if generator == 'async' else sync_chunks
+    await run_mock_server(event_loop, unused_tcp_port, messaging=mock_protocol)
+    worker = await connect_worker(event_loop, unused_tcp_port, lambda: Worker((func, 'chunks'), loop=event_loop))
+    await asyncio.wait_for(completed, timeout=1)
+    assert received == [
+        PacketType.WORK_DATA, PacketType.WORK_STATUS, PacketType.WORK_DATA, PacketType.WORK_COMPLETE]
+    await worker.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_client_stream(event_loop, unused_tcp_port):
+    mock_protocol = {
+        PacketType.SUBMIT_JOB: [
+            (PacketType.JOB_CREATED, 'test_handle'),
+            (PacketType.WORK_DATA, 'test_handle', 'first'),
+            (PacketType.WORK_STATUS, 'test_handle', '1', '2'),
+            (PacketType.WORK_WARNING, 'test_handle', 'careful'),
+            (PacketType.WORK_DATA, 'test_handle', 'second'),
+            (PacketType.WORK_COMPLETE, 'test_handle', ''),
+        ],
+    }
+    await run_mock_server(event_loop, unused_tcp_port, messaging=mock_protocol)
+    client = await connect_client(event_loop, unused_tcp_port, lambda: Client(loop=event_loop))
+    job_created = await client.submit_job('chunks', 'workload', stream=True)
+
+    updates = []
+    async for update in client.stream(job_created.handle):
+        updates.append(update)
+
+    assert updates == [
+        WorkData('test_handle', 'first'),
+        WorkStatus('test_handle', 1, 2),
+        WorkWarning('test_handle', 'careful'),
+        WorkData('test_handle', 'second'),
+        WorkComplete('test_handle', ''),
+    ]
+    assert not client.streams
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_unconsumed_streams_are_dropped(event_loop, unused_tcp_port):
+    await run_job_server(event_loop, unused_tcp_port)
+    client = await connect_client(event_loop, unused_tcp_port, lambda: Client(loop=event_loop))
+    client._max_finished_streams = 2
+
+    async def run(workload):
+        job_created = await client.submit_job('reverse', workload, stream=True)
+        await client.wait_job(job_created.handle)
+        return job_created.handle
+
+    handles = [await asyncio.wait_for(run('job-{}'.format(i)), timeout=1) for i in range(5)]
+    await asyncio.sleep(0)
+    assert not client.streams
+    assert list(client._finished_streams) == handles[-2:]
+
+    # Completed streams are still there to be iterated for a while
+    updates = [update async for update in client.stream(handles[-1])]
+    assert updates == [WorkComplete(handles[-1], '4-boj')]
+    assert list(client._finished_streams) == handles[-2:-1]
+    await client.close()
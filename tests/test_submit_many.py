@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from aiogear import Client, PacketType
+from aiogear.response import WorkComplete
+from .utils import JobServerMock, connect_client
+
+
+class WindowServerMock(JobServerMock):
+    max_pending = 0
+
+    def on_submit(self, packet, payload):
+        super(WindowServerMock, self).on_submit(packet, payload)
+        WindowServerMock.max_pending = max(WindowServerMock.max_pending, len(self.pending))
+
+
+async def collect(results):
+    return [result async for result in results]
+
+
+@pytest.mark.asyncio
+async def test_submit_many(event_loop, unused_tcp_port):
+    servers = []
+
+    def factory():
+        servers.append(WindowServerMock(event_loop, batch=50, shuffle=True))
+        return servers[-1]
+
+    await event_loop.create_server(factory, '127.0.0.1', unused_tcp_port)
+    client = await connect_client(event_loop, unused_tcp_port, lambda: Client(loop=event_loop))
+    workloads = ['job-{}'.format(i) for i in range(2000)]
+    results = await asyncio.wait_for(collect(client.submit_many('reverse', workloads, window=100)), timeout=10)
+
+    assert len(results) == len(workloads)
+    submitted = {uuid: workload.decode('ascii') for _, _, uuid, workload, _ in servers[0].submitted}
+    for uuid, handle, response in results:
+        assert response == WorkComplete(handle, submitted[uuid][::-1])
+    assert WindowServerMock.max_pending <= 100
+    assert not client.handles
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_submit_many_background(event_loop, unused_tcp_port):
+    servers = []
+
+    def factory():
+        servers.append(JobServerMock(event_loop))
+        return servers[-1]
+
+    await event_loop.create_server(factory, '127.0.0.1', unused_tcp_port)
+    client = await connect_client(event_loop, unused_tcp_port, lambda: Client(loop=event_loop))
+    workloads = ['job-{}'.format(i) for i in range(100)]
+    results = await asyncio.wait_for(
+        collect(client.submit_many('reverse', workloads, priority=PacketType.SUBMIT_JOB_BG, window=10)), timeout=1)
+
+    assert [handle for _, handle in results] == ['H:mock:{}'.format(i) for i in range(100)]
+    assert all(packet == PacketType.SUBMIT_JOB_BG for packet, *_ in servers[0].submitted)
+    assert not client.handles
+    await client.close()
@@ -0,0 +1,74 @@
+import gc
+import os.path
+import time
+import queue
+import signal
+import asyncio
+import argparse
+
+import pytest
+
+from aiogear.supervisor import Supervisor, load_function, parse_args, serve
+
+
+def test_load_function():
+    assert load_function('os.path:basename') is os.path.basename
+    assert load_function('os:path.join') is os.path.join
+
+
+@pytest.mark.parametrize('spec', ['os.path', ':basename', 'os.path:missing', 'missing_module:func'])
+def test_load_function_invalid(spec):
+    with pytest.raises(argparse.ArgumentTypeError):
+        load_function(spec)
+
+
+def test_parse_args():
+    args = parse_args(['-w', '4', '-c', '2', '--eager', 'os.path:basename'])
+    assert args.processes == 4
+    assert args.connections == 2
+    assert args.eager
+    assert args.functions == ['os.path:basename']
+
+
+class ProcessMock:
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.pid = 1
+        self.exitcode = None if alive else 1
+
+    def is_alive(self):
+        return self.alive
+
+
+def test_check_children_restarts(monkeypatch):
+    supervisor = Supervisor(parse_args(['-w', '2', '--restart-delay', '0.05', 'os.path:basename']))
+    spawned = []
+    monkeypatch.setattr(supervisor, 'spawn', spawned.append)
+    supervisor.children = {0: ProcessMock(), 1: ProcessMock(alive=False)}
+
+    supervisor.check_children()
+    assert supervisor.restarts == {1: 1}
+    assert not spawned
+    # Not restarted before the delay
+    supervisor.check_children()
+    assert not spawned
+    time.sleep(0.05)
+    supervisor.check_children()
+    assert spawned == [1]
+    assert not supervisor.restart_at
+
+
+@pytest.mark.asyncio
+async def test_serve_shutdown(event_loop, unused_tcp_port, caplog):
+    # Nothing listens on the port, the workers are still connecting
+    args = parse_args(['-p', str(unused_tcp_port), '-c', '2', '--report-interval', '0.01', 'os.path:basename'])
+    reports = queue.Queue()
+    serving = asyncio.ensure_future(serve(args, 0, reports, event_loop), loop=event_loop)
+    index, pid, _ = await asyncio.wait_for(event_loop.run_in_executor(None, reports.get), timeout=1)
+    assert (index, pid) == (0, os.getpid())
+
+    os.kill(os.getpid(), signal.SIGTERM)
+    await asyncio.wait_for(serving, timeout=1)
+    event_loop.remove_signal_handler(signal.SIGTERM)
+    gc.collect()
+    assert not [record for record in caplog.records if record.levelname == 'ERROR']
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from aiogear import PacketType, Worker
+from .utils import run_mock_server, connect_worker
+
+
+def _mock_protocol(jobs, completed, expected):
+    assigned = 0
+
+    def pre_sleep(_):
+        if assigned < jobs:
+            return PacketType.NOOP,
+
+    def grab_job(_):
+        nonlocal assigned
+        if assigned >= jobs:
+            return PacketType.NO_JOB,
+        assigned += 1
+        return PacketType.JOB_ASSIGN, 'handle_{}'.format(assigned), 'double', str(assigned)
+
+    def work_complete(packet):
+        completed.append(packet)
+        if len(completed) == expected.result_count:
+            expected.set_result(True)
+
+    return {
+        PacketType.PRE_SLEEP: pre_sleep,
+        PacketType.GRAB_JOB: grab_job,
+        PacketType.WORK_COMPLETE: work_complete,
+        PacketType.WORK_EXCEPTION: work_complete,
+    }
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('jobs, size, max_in_flight, expected_batches', [
+    (6, 3, 3, [3, 3]),
+    (2, 3, 3, [2]),
+    (4, 8, 2, [2, 2]),
+])
+async def test_batches(event_loop, unused_tcp_port, jobs, size, max_in_flight, expected_batches):
+    batches = []
+    completed = []
+    done = event_loop.create_future()
+    done.result_count = jobs
+
+    def double(job_infos):
+        batches.append(len(job_infos))
+        return [str(int(job_info.workload) * 2) for job_info in job_infos]
+
+    await run_mock_server(event_loop, unused_tcp_port, messaging=_mock_protocol(jobs, completed, done))
+    factory = lambda: Worker(
+        double, loop=event_loop, eager=True, max_in_flight=max_in_flight, batches={'double': (size, 0.05)})
+    worker = await connect_worker(event_loop, unused_tcp_port, factory)
+    await asyncio.wait_for(done, timeout=1)
+
+    assert batches == expected_batches
+    assert completed == [PacketType.WORK_COMPLETE] * jobs
+    assert worker.batch_stats['double']['jobs'] == jobs
+    assert worker.batch_stats['double']['batches'] == len(expected_batches)
+    await worker.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_batch_exceptions(event_loop, unused_tcp_port):
+    completed = []
+    done = event_loop.create_future()
+    done.result_count = 2
+
+    def double(job_infos):
+        return ['ok', ValueError('bad workload')]
+
+    await run_mock_server(event_loop, unused_tcp_port, messaging=_mock_protocol(2, completed, done))
+    factory = lambda: Worker(
+        double, loop=event_loop, eager=True, max_in_flight=2, batches={'double': (2, 0.05)})
+    worker = await connect_worker(event_loop, unused_tcp_port, factory)
+    await asyncio.wait_for(done, timeout=1)
+
+    assert completed == [PacketType.WORK_COMPLETE, PacketType.WORK_EXCEPTION]
+    await worker.shutdown()
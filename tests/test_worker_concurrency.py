@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from aiogear import PacketType, Worker
+from .utils import run_mock_server, connect_worker
+
+
+def _job_assigner(jobs):
+    counter = 0
+
+    def assign(_):
+        nonlocal counter
+        if counter >= jobs:
+            return PacketType.NO_JOB,
+        counter += 1
+        return PacketType.JOB_ASSIGN, 'handle_{}'.format(counter), 'wait', 'workload'
+    return assign
+
+
+@pytest.mark.asyncio
+async def test_max_in_flight(event_loop, unused_tcp_port):
+    all_running = event_loop.create_future()
+    completed = event_loop.create_future()
+    running = 0
+    peak = 0
+    done = 0
+
+    async def wait(job_info):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        if running == 3 and not all_running.done():
+            all_running.set_result(True)
+        await all_running
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    def work_complete(_):
+        nonlocal done
+        done += 1
+        if done == 6:
+            completed.set_result(True)
+
+    mock_protocol = {
+        PacketType.PRE_SLEEP: (PacketType.NOOP,),
+        PacketType.GRAB_JOB: _job_assigner(6),
+        PacketType.WORK_COMPLETE: work_complete,
+    }
+    await run_mock_server(event_loop, unused_tcp_port, messaging=mock_protocol)
+    factory = lambda: Worker(wait, loop=event_loop, max_in_flight=3)
+    worker = await connect_worker(event_loop, unused_tcp_port, factory)
+    await asyncio.wait_for(completed, timeout=1)
+    assert peak == 3
+    await worker.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_graceful_shutdown_drains_jobs(event_loop, unused_tcp_port):
+    started = event_loop.create_future()
+    completed = []
+
+    async def wait(job_info):
+        if not started.done():
+            started.set_result(True)
+        await asyncio.sleep(0.05)
+
+    mock_protocol = {
+        PacketType.PRE_SLEEP: (PacketType.NOOP,),
+        PacketType.GRAB_JOB: _job_assigner(2),
+        PacketType.WORK_COMPLETE: lambda packet: completed.append(packet),
+    }
+    await run_mock_server(event_loop, unused_tcp_port, messaging=mock_protocol)
+    factory = lambda: Worker(wait, loop=event_loop, max_in_flight=2)
+    worker = await connect_worker(event_loop, unused_tcp_port, factory)
+    await asyncio.wait_for(started, timeout=1)
+    await asyncio.sleep(0.01)
+    await asyncio.wait_for(worker.shutdown(graceful=True), timeout=1)
+    await asyncio.sleep(0.01)
+    assert len(completed) == 2
+
+
+@pytest.mark.asyncio
+async def test_eager_grab_skips_pre_sleep(event_loop, unused_tcp_port):
+    received = []
+    slept = event_loop.create_future()
+
+    def pre_sleep(packet):
+        received.append(packet)
+        if not slept.done():
+            slept.set_result(True)
+
+    mock_protocol = {
+        PacketType.PRE_SLEEP: pre_sleep,
+        PacketType.GRAB_JOB: _job_assigner(3),
+        PacketType.WORK_COMPLETE: lambda packet: received.append(packet),
+    }
+    await run_mock_server(event_loop, unused_tcp_port, messaging=mock_protocol)
+    factory = lambda: Worker((lambda job_info: 'done', 'wait'), loop=event_loop, eager=True)
+    worker = await connect_worker(event_loop, unused_tcp_port, factory)
+    await asyncio.wait_for(slept, timeout=1)
+    assert received == [PacketType.WORK_COMPLETE] * 3 + [PacketType.PRE_SLEEP]
+    await worker.shutdown()
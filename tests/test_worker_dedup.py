@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from aiogear import PacketType, Worker, Client
+from aiogear.cache import ResultCache
+from .utils import run_mock_server, connect_worker
+
+
+@pytest.mark.asyncio
+async def test_repeated_unique_jobs(event_loop, unused_tcp_port):
+    calls = []
+    completed = asyncio.Queue()
+    handles = iter(range(100))
+
+    def reverse(job_info):
+        calls.append(job_info.uuid)
+        return job_info.workload[::-1]
+
+    def assign(_):
+        handle = next(handles)
+        # Every other job repeats the first uuid
+        uuid = 'same' if handle % 2 else 'uuid-{}'.format(handle)
+        return PacketType.JOB_ASSIGN_UNIQ, 'H:{}'.format(handle), 'reverse', uuid, 'test'
+
+    mock_protocol = {
+        PacketType.PRE_SLEEP: (PacketType.NOOP,),
+        PacketType.GRAB_JOB_UNIQ: assign,
+        PacketType.WORK_COMPLETE: lambda packet: completed.put_nowait(packet),
+    }
+    await run_mock_server(event_loop, unused_tcp_port, messaging=mock_protocol)
+    dedup = ResultCache(ttl=60)
+    worker = await connect_worker(event_loop, unused_tcp_port, lambda: Worker(
+        reverse, loop=event_loop, grab_type=PacketType.GRAB_JOB_UNIQ, dedup=dedup))
+    for _ in range(10):
+        await asyncio.wait_for(completed.get(), timeout=1)
+    await worker.shutdown()
+
+    assert calls.count('same') == 1
+    assert worker.stats['dedup_hits'] >= 4
+    assert dedup.get(('reverse', 'same')) == 'tset'
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('raw', [False, True])
+async def test_binary_uuids(event_loop, unused_tcp_port, raw):
+    calls = []
+    completed = asyncio.Queue()
+    handles = iter(range(100))
+    # Raw uuid4 bytes are rarely valid UTF-8
+    uuids = [Client.uuid() for _ in range(2)]
+
+    def echo(job_info):
+        calls.append(job_info.uuid)
+        return 'done'
+
+    def assign(_):
+        handle = next(handles)
+        return PacketType.JOB_ASSIGN_UNIQ, 'H:{}'.format(handle), 'echo', uuids[handle % 2], 'test'
+
+    mock_protocol = {
+        PacketType.PRE_SLEEP: (PacketType.NOOP,),
+        PacketType.GRAB_JOB_UNIQ: assign,
+        PacketType.WORK_COMPLETE: lambda packet: completed.put_nowait(packet),
+    }
+    await run_mock_server(event_loop, unused_tcp_port, messaging=mock_protocol)
+    worker = await connect_worker(event_loop, unused_tcp_port, lambda: Worker(
+        echo, loop=event_loop, grab_type=PacketType.GRAB_JOB_UNIQ, dedup=ResultCache(), raw=raw))
+    for _ in range(6):
+        await asyncio.wait_for(completed.get(), timeout=1)
+    await worker.shutdown()
+
+    assert [uuid.encode('utf8', 'surrogateescape') for uuid in calls] == uuids
+    assert worker.stats['dedup_hits'] >= 4
+
+
+@pytest.mark.asyncio
+async def test_unsendable_results_are_not_replayed(event_loop, unused_tcp_port):
+    answered = asyncio.Queue()
+    calls = []
+    handles = iter(range(100))
+
+    def count(job_info):
+        calls.append(job_info.uuid)
+        return 42
+
+    def assign(_):
+        handle = next(handles)
+        uuid = 'stale' if handle % 2 else 'same'
+        return PacketType.JOB_ASSIGN_UNIQ, 'H:{}'.format(handle), 'count', uuid, 'test'
+
+    mock_protocol = {
+        PacketType.PRE_SLEEP: (PacketType.NOOP,),
+        PacketType.GRAB_JOB_UNIQ: assign,
+        PacketType.WORK_COMPLETE: lambda packet: answered.put_nowait(packet),
+        PacketType.WORK_EXCEPTION: lambda packet: answered.put_nowait(packet),
+    }
+    await run_mock_server(event_loop, unused_tcp_port, messaging=mock_protocol)
+    dedup = ResultCache()
+    # Left behind by an older worker
+    dedup.set(('count', 'stale'), 42)
+    worker = await connect_worker(event_loop, unused_tcp_port, lambda: Worker(
+        count, loop=event_loop, grab_type=PacketType.GRAB_JOB_UNIQ, dedup=dedup))
+    for _ in range(6):
+        assert await asyncio.wait_for(answered.get(), timeout=1) == PacketType.WORK_EXCEPTION
+    assert not worker.main_task.done()
+    await worker.shutdown()
+
+    assert calls.count('same') >= 3
+    assert dedup.get(('count', 'same')) is None
+    assert not worker.stats['dedup_hits']
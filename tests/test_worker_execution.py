@@ -0,0 +1,85 @@
+import os
+import asyncio
+import threading
+
+import pytest
+
+from aiogear import PacketType, Worker, ExecutionMode
+from .utils import run_mock_server, connect_worker
+
+
+def current_thread(job_info):
+    return str(threading.get_ident())
+
+
+def current_process(job_info):
+    return str(os.getpid())
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('func, mode, on_loop', [
+    (current_thread, ExecutionMode.INLINE, True),
+    (current_thread, ExecutionMode.THREAD, False),
+    (current_process, ExecutionMode.PROCESS, False),
+])
+async def test_execution_mode(event_loop, unused_tcp_port, func, mode, on_loop):
+    received = event_loop.create_future()
+    results = []
+
+    def _complete(packet):
+        received.set_result(packet)
+
+    mock_protocol = {
+        PacketType.PRE_SLEEP: (PacketType.NOOP,),
+        PacketType.GRAB_JOB: (PacketType.JOB_ASSIGN, 'test_handle', 'func', 'test_workload'),
+        PacketType.WORK_COMPLETE: _complete,
+    }
+
+    await run_mock_server(event_loop, unused_tcp_port, messaging=mock_protocol)
+    factory = lambda: Worker((func, 'func', mode), loop=event_loop)
+    worker = await connect_worker(event_loop, unused_tcp_port, factory)
+    worker.work_complete = lambda handle, result: (results.append(result),
+                                                   worker.send(PacketType.WORK_COMPLETE, handle, result))
+    await asyncio.wait_for(received, timeout=5)
+    await worker.shutdown()
+
+    assert (results[0] == func(None)) is on_loop
+
+
+def test_coroutine_function_must_be_inline():
+    async def coro(job_info):
+        pass
+
+    with pytest.raises(RuntimeError):
+        Worker((coro, 'coro', ExecutionMode.THREAD))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('mode', [ExecutionMode.THREAD, ExecutionMode.PROCESS])
+async def test_generators_run_inline(event_loop, unused_tcp_port, mode):
+    received = []
+    completed = event_loop.create_future()
+
+    def chunks(job_info):
+        yield 'first'
+        yield 'second'
+
+    def _record(packet):
+        received.append(packet)
+        if packet == PacketType.WORK_COMPLETE:
+            completed.set_result(True)
+
+    mock_protocol = {
+        PacketType.PRE_SLEEP: (PacketType.NOOP,),
+        PacketType.GRAB_JOB: (PacketType.JOB_ASSIGN, 'test_handle', 'chunks', 'test_workload'),
+        PacketType.WORK_DATA: _record,
+        PacketType.WORK_COMPLETE: _record,
+        PacketType.WORK_EXCEPTION: _record,
+    }
+    await run_mock_server(event_loop, unused_tcp_port, messaging=mock_protocol)
+    worker = await connect_worker(event_loop, unused_tcp_port, lambda: Worker(chunks, loop=event_loop, mode=mode))
+    await asyncio.wait_for(completed, timeout=1)
+    await worker.shutdown()
+
+    assert worker.modes['chunks'] is ExecutionMode.INLINE
+    assert received == [PacketType.WORK_DATA, PacketType.WORK_DATA, PacketType.WORK_COMPLETE]
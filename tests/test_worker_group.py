@@ -0,0 +1,115 @@
+import random
+import asyncio
+from collections import Counter
+
+import pytest
+
+from aiogear import PacketType, Budget, WorkerGroup
+from .utils import GearmanServerMock
+
+
+@pytest.mark.asyncio
+async def test_budget_capacity(event_loop):
+    budget = Budget(2, loop=event_loop)
+    await budget.acquire('a')
+    await budget.acquire('b')
+    waiting = asyncio.ensure_future(budget.acquire('a'))
+    await asyncio.sleep(0)
+    assert not waiting.done()
+
+    budget.release()
+    await asyncio.wait_for(waiting, timeout=1)
+    assert budget.in_use == 2
+
+
+@pytest.mark.asyncio
+async def test_budget_weighted_grants(event_loop):
+    budget = Budget(1, loop=event_loop)
+    budget.register('light', 1)
+    budget.register('heavy', 3)
+    grants = Counter()
+
+    async def member(name):
+        while True:
+            await budget.acquire(name)
+            grants[name] += 1
+            try:
+                await asyncio.sleep(0)
+            finally:
+                budget.release()
+
+    tasks = [asyncio.ensure_future(member(name)) for name in ['light', 'heavy']]
+    await asyncio.sleep(0.05)
+    for task in tasks:
+        task.cancel()
+    await asyncio.wait(tasks)
+
+    assert grants['heavy'] > 2 * grants['light'] > 0
+    assert budget.in_use == 0
+
+
+@pytest.mark.asyncio
+async def test_budget_cancelled_waiter(event_loop):
+    budget = Budget(1, loop=event_loop)
+    await budget.acquire('a')
+    waiting = asyncio.ensure_future(budget.acquire('b'))
+    await asyncio.sleep(0)
+    waiting.cancel()
+    await asyncio.sleep(0)
+    budget.release()
+    assert budget.in_use == 0
+    assert not budget.waiters
+
+
+def busy_server(loop, prefix, grabs):
+    counter = iter(range(10 ** 6))
+
+    def assign(_):
+        grabs[prefix] += 1
+        return PacketType.JOB_ASSIGN, '{}{}'.format(prefix, next(counter)), 'sleep', ''
+
+    return lambda: GearmanServerMock(loop, messaging={
+        PacketType.PRE_SLEEP: (PacketType.NOOP,),
+        PacketType.GRAB_JOB: assign,
+    })
+
+
+def idle_server(loop, prefix, grabs):
+    def no_job(_):
+        grabs[prefix] += 1
+        return PacketType.NO_JOB,
+
+    return lambda: GearmanServerMock(loop, messaging={PacketType.GRAB_JOB: no_job})
+
+
+@pytest.mark.asyncio
+async def test_group_shares_capacity(event_loop, unused_tcp_port_factory):
+    grabs = Counter()
+    running = []
+    peak = 0
+
+    async def sleep(job_info):
+        nonlocal peak
+        running.append(job_info.handle)
+        peak = max(peak, len(running))
+        await asyncio.sleep(random.uniform(0.005, 0.01))
+        running.remove(job_info.handle)
+
+    ports = [unused_tcp_port_factory() for _ in range(3)]
+    await event_loop.create_server(busy_server(event_loop, 'H:a:', grabs), '127.0.0.1', ports[0])
+    await event_loop.create_server(busy_server(event_loop, 'H:b:', grabs), '127.0.0.1', ports[1])
+    await event_loop.create_server(idle_server(event_loop, 'H:idle:', grabs), '127.0.0.1', ports[2])
+
+    group = WorkerGroup(
+        sleep, servers=[('127.0.0.1', ports[0], 1), ('127.0.0.1', ports[1], 3), ('127.0.0.1', ports[2])],
+        capacity=4, loop=event_loop, eager=True)
+    await group.connect()
+    await asyncio.sleep(0.2)
+    await group.shutdown(graceful=True)
+
+    assert peak <= 4
+    assert grabs['H:b:'] > 1.5 * grabs['H:a:'] > 0
+    # Left sleeping after the first NO_JOB
+    assert grabs['H:idle:'] == 1
+    assert group.stats['complete'] >= grabs['H:a:'] + grabs['H:b:'] - 4
+    assert group.budget.in_use == 0
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from aiogear import PacketType, ManagedWorker
+from .utils import GearmanServerMock
+
+
+@pytest.mark.asyncio
+async def test_reconnect_registers_again(event_loop, unused_tcp_port):
+    servers = []
+    registered = asyncio.Queue()
+
+    def factory():
+        server = GearmanServerMock(event_loop, messaging={
+            PacketType.CAN_DO: lambda packet: registered.put_nowait(packet),
+        })
+        servers.append(server)
+        return server
+
+    await event_loop.create_server(factory, '127.0.0.1', unused_tcp_port)
+    worker = ManagedWorker(
+        (lambda job_info: None, 'func_test'), loop=event_loop, port=unused_tcp_port, min_backoff=0.01)
+    await asyncio.wait_for(worker.connect(), timeout=1)
+    await asyncio.wait_for(registered.get(), timeout=1)
+    first_task = worker.main_task
+
+    servers[0].transport.close()
+    await asyncio.wait_for(registered.get(), timeout=1)
+
+    assert len(servers) == 2
+    assert worker.stats['reconnects'] == 1
+    assert first_task.cancelled()
+    assert worker.main_task is not first_task
+    await worker.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_connect_retries_with_backoff(event_loop, unused_tcp_port):
+    connected = event_loop.create_future()
+    worker = ManagedWorker(
+        (lambda job_info: None, 'func_test'), loop=event_loop, port=unused_tcp_port, min_backoff=0.01)
+    connecting = asyncio.ensure_future(worker.connect())
+    await asyncio.sleep(0.05)
+    assert worker.stats['connect_failures'] > 0
+
+    await event_loop.create_server(
+        lambda: GearmanServerMock(event_loop, messaging={
+            PacketType.CAN_DO: lambda packet: connected.set_result(True)
+        }), '127.0.0.1', unused_tcp_port)
+    await asyncio.wait_for(connecting, timeout=1)
+    assert await asyncio.wait_for(connected, timeout=1)
+    await worker.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_running_jobs_aborted_on_connection_lost(event_loop, unused_tcp_port):
+    servers = []
+    started = event_loop.create_future()
+
+    async def wait(job_info):
+        started.set_result(True)
+        await asyncio.sleep(10)
+
+    def factory():
+        server = GearmanServerMock(event_loop, messaging={
+            PacketType.PRE_SLEEP: (PacketType.NOOP,),
+            PacketType.GRAB_JOB: (PacketType.JOB_ASSIGN, 'test_handle', 'wait', 'test_workload'),
+        } if not servers else {})
+        servers.append(server)
+        return server
+
+    await event_loop.create_server(factory, '127.0.0.1', unused_tcp_port)
+    worker = ManagedWorker(wait, loop=event_loop, port=unused_tcp_port, min_backoff=0.01)
+    await worker.connect()
+    await asyncio.wait_for(started, timeout=1)
+    task = worker.running['test_handle']
+
+    servers[0].transport.close()
+    await asyncio.sleep(0.05)
+    assert task.cancelled()
+    assert worker.stats['aborted'] == 1
+    assert not worker.running
+    await worker.shutdown()
@@ -26,3 +26,15 @@ def test_register_function_connected(worker):
 @pytest.mark.xfail(raises=RuntimeError)
 def test_register_function_not_connected(worker):
     worker.register_function(lambda x: x)
+
+
+def test_register_function_with_timeout():
+    worker = Worker(timeouts={'test_register': 5})
+    worker.get_task = mock.Mock()
+    written = []
+    trans = mock.Mock()
+    trans.write = written.append
+    worker.connection_made(trans)
+    worker.register_function(lambda x: x, 'test_register')
+    worker._flush_writes()
+    assert written[-1] == worker.serialize_request(PacketType.CAN_DO_TIMEOUT, 'test_register', 5)
@@ -1,4 +1,5 @@
 import struct
+import random
 import asyncio
 import inspect
 from aiogear import PacketType
@@ -12,7 +13,10 @@ class GearmanServerMock(asyncio.Protocol):
         self.data = b''
 
     def extract_packets(self):
-        packets = []
+        return [packet for packet, _ in self.extract_frames()]
+
+    def extract_frames(self):
+        frames = []
         while True:
             data = self.data
             header = '>4sII'
@@ -22,13 +26,11 @@ class GearmanServerMock(asyncio.Protocol):
             except struct.error:
                 break
 
-            packets.append(PacketType(num))
             if len(data[offset:]) < size:
-                self.data = data[offset:]
                 break
-            else:
-                self.data = data[offset + size:]
-        return packets
+            frames.append((PacketType(num), data[offset:offset + size]))
+            self.data = data[offset + size:]
+        return frames
 
     def connection_made(self, transport):
         self.transport = transport
@@ -42,7 +44,13 @@ class GearmanServerMock(asyncio.Protocol):
                 continue
 
             if inspect.isfunction(response_or_cb):
-                response_or_cb(incoming)
+                # Callbacks may answer by returning a response tuple
+                response = response_or_cb(incoming)
+                if response:
+                    self.transport.write(self.serialize_response(*response))
+            elif isinstance(response_or_cb, list):
+                for response in response_or_cb:
+                    self.transport.write(self.serialize_response(*response))
             else:
                 serialized = self.serialize_response(*response_or_cb)
                 self.transport.write(serialized)
@@ -51,15 +59,77 @@ class GearmanServerMock(asyncio.Protocol):
     def serialize_response(packet, *args):
         magic = b'\0RES'
         delimiter = b'\0'
-        payload = delimiter.join([a.encode('ascii') for a in args])
+        payload = delimiter.join([a if isinstance(a, bytes) else a.encode('ascii') for a in args])
         return struct.pack('>4sII', magic, packet.value, len(payload)) + payload
 
 
+class JobServerMock(GearmanServerMock):
+    """
+    Accepts submitted jobs with sequential handles and completes foreground
+    ones with the reversed workload. Completions are held back until
+    `batch` jobs are pending and then sent in shuffled order when `shuffle`
+    is set.
+    """
+    submit_packets = {
+        PacketType.SUBMIT_JOB, PacketType.SUBMIT_JOB_HIGH, PacketType.SUBMIT_JOB_LOW,
+    }
+    submit_bg_packets = {
+        PacketType.SUBMIT_JOB_BG, PacketType.SUBMIT_JOB_HIGH_BG, PacketType.SUBMIT_JOB_LOW_BG,
+    }
+
+    def __init__(self, loop, batch=1, shuffle=False, prefix='H:mock:', **kw):
+        super(JobServerMock, self).__init__(loop, **kw)
+        self.batch = batch
+        self.shuffle = shuffle
+        self.prefix = prefix
+        self.pending = []
+        self.submitted = []
+        self.counter = 0
+
+    def data_received(self, data):
+        self.data += data
+        for incoming, payload in self.extract_frames():
+            if incoming in self.submit_packets or incoming in self.submit_bg_packets:
+                self.on_submit(incoming, payload)
+            elif incoming in self.messaging:
+                self.transport.write(self.serialize_response(*self.messaging[incoming]))
+        self.flush()
+
+    def on_submit(self, packet, payload):
+        function, uuid, workload = payload.split(b'\0', 2)
+        handle = '{}{}'.format(self.prefix, self.counter)
+        self.counter += 1
+        self.submitted.append((packet, function, uuid, workload, handle))
+        self.transport.write(self.serialize_response(PacketType.JOB_CREATED, handle))
+        if packet in self.submit_packets:
+            self.pending.append((handle, workload[::-1].decode('ascii')))
+
+    def flush(self, force=False):
+        if not self.pending or (len(self.pending) < self.batch and not force):
+            return
+        pending, self.pending = self.pending, []
+        if self.shuffle:
+            random.shuffle(pending)
+        self.transport.write(b''.join(
+            self.serialize_response(PacketType.WORK_COMPLETE, handle, result)
+            for handle, result in pending))
+
+
 def run_mock_server(loop, run_port, **kw):
     return loop.create_server(
         lambda: GearmanServerMock(loop, **kw), '127.0.0.1', run_port)
 
 
+def run_job_server(loop, run_port, **kw):
+    return loop.create_server(
+        lambda: JobServerMock(loop, **kw), '127.0.0.1', run_port)
+
+
+async def connect_client(loop, server_port, client_factory):
+    _, client = await loop.create_connection(client_factory, '127.0.0.1', server_port)
+    return client
+
+
 async def connect_worker(loop, server_port, worker_factory):
     _, worker = await loop.create_connection(worker_factory, '127.0.0.1', server_port)
     return worker